@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import islice
+from multiprocessing import Pool
+from time import perf_counter
+
+import numpy as np
+
+from codec import NAMES
+
+# piece balance statistics over game records with a log, as written by
+# simulate.py (and tournament.py --logs). records are read as a stream in
+# chunks, a worker replays the logs of a chunk into plain counters and hands
+# back numpy arrays that are summed into the totals, so memory stays bounded
+# by the chunk size and the number of chunks in flight.
+#
+# every statistic is kept per kind, the piece index * 2 + flipped:
+#
+#   placed     put on the board, setup and spawns
+#   spawned    drawn from the bag and placed
+#   actions    moves, strikes and commands made in this state
+#   captures   enemies taken by moves, strikes and commands given
+#   lost       taken in this state
+#   lifetime   plies spent on the board in this state, until flipped, taken
+#              or the game ended
+#
+# win correlation is the correlation, over every (game, side), between how
+# often a side acted with the kind and its result (1 won, 0.5 draw, 0 lost).
+
+KINDS = 2 * len(NAMES)
+INDEX = {name: i for i, name in enumerate(NAMES)}
+FIELDS = ("placed", "spawned", "actions", "captures", "lost", "lifetime")
+PLACED, SPAWNED, ACTIONS, CAPTURES, LOST, LIFETIME = range(len(FIELDS))
+CHUNK = 2000
+
+
+@dataclass(slots=True)
+class Totals:
+    games: int = 0
+    counts: np.ndarray = field(
+        default_factory=lambda: np.zeros((len(FIELDS), KINDS), dtype=np.int64)
+    )
+    # sums for the win correlation: samples, x, x * x, x * y, y, y * y
+    samples: int = 0
+    sx: np.ndarray = field(default_factory=lambda: np.zeros(KINDS))
+    sxx: np.ndarray = field(default_factory=lambda: np.zeros(KINDS))
+    sxy: np.ndarray = field(default_factory=lambda: np.zeros(KINDS))
+    sy: float = 0.0
+    syy: float = 0.0
+
+    def add(self, other: Totals):
+        self.games += other.games
+        self.counts += other.counts
+        self.samples += other.samples
+        self.sx += other.sx
+        self.sxx += other.sxx
+        self.sxy += other.sxy
+        self.sy += other.sy
+        self.syy += other.syy
+
+    def correlation(self) -> np.ndarray:
+        n = self.samples
+        covariance = n * self.sxy - self.sx * self.sy
+        spread = (n * self.sxx - self.sx**2) * (n * self.syy - self.sy**2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(spread > 0, covariance / np.sqrt(spread), np.nan)
+
+    def report(self) -> list[dict]:
+        counts = self.counts
+        correlation = self.correlation()
+        rows = []
+        for kind in range(KINDS):
+            placed = counts[PLACED, kind]
+            actions = counts[ACTIONS, kind]
+            if not (placed or actions or counts[LOST, kind]):
+                continue
+            row = {
+                "piece": NAMES[kind // 2],
+                "flipped": bool(kind & 1),
+                **{name: int(counts[i, kind]) for i, name in enumerate(FIELDS)},
+            }
+            row["spawns_per_game"] = round(counts[SPAWNED, kind] / self.games, 4)
+            row["captures_per_action"] = (
+                round(counts[CAPTURES, kind] / actions, 4) if actions else None
+            )
+            row["win_correlation"] = (
+                None
+                if np.isnan(correlation[kind])
+                else round(float(correlation[kind]), 4)
+            )
+            # pieces are always placed unflipped, so lifetime and survival
+            # are per piece placed of the type
+            piece = kind & ~1
+            placed = counts[PLACED, piece]
+            lost = counts[LOST, piece] + counts[LOST, piece + 1]
+            row["mean_lifetime"] = (
+                round(counts[LIFETIME, kind] / placed, 2) if placed else None
+            )
+            row["survival"] = round(1 - lost / placed, 4) if placed else None
+            rows.append(row)
+        return rows
+
+
+# replays one log into the counters, used gets how often each side acted per kind
+def scan(log, counts: list[int], used: list[int]):
+    board = [None] * 36  # (kind, ply since) in side 0 coordinates
+    index = INDEX
+
+    def take(square, ply):
+        kind, since = board[square]
+        counts[LOST * KINDS + kind] += 1
+        counts[LIFETIME * KINDS + kind] += ply - since
+        board[square] = None
+
+    for ply, entry in enumerate(log):
+        side = entry[0]
+        # coordinates are seen from the acting side, side 1 sees the board
+        # rotated
+        flip = 35 if side else 0
+        action = entry[1]
+        if action == "p" or action == "s":
+            kind = index[entry[2]] * 2
+            counts[PLACED * KINDS + kind] += 1
+            if action == "s":
+                counts[SPAWNED * KINDS + kind] += 1
+            board[abs(flip - (entry[3] * 6 + entry[4]))] = (kind, ply)
+            continue
+
+        source = abs(flip - (entry[2] * 6 + entry[3]))
+        if action == "c":
+            mover = abs(flip - (entry[4] * 6 + entry[5]))
+            target = abs(flip - (entry[6] * 6 + entry[7]))
+            rest = entry[8:]
+        else:
+            mover = source if action == "m" else None
+            target = abs(flip - (entry[4] * 6 + entry[5]))
+            rest = entry[6:]
+        kind = index[rest[0]] * 2 + rest[1]
+        counts[ACTIONS * KINDS + kind] += 1
+        used[side * KINDS + kind] += 1
+        if len(rest) > 2:
+            counts[CAPTURES * KINDS + kind] += 1
+            take(target, ply)
+        if mover is not None:
+            board[target] = board[mover]
+            board[mover] = None
+        # the acting piece flips, a commanded piece does not
+        square = target if action == "m" else source
+        acting, since = board[square]
+        counts[LIFETIME * KINDS + acting] += ply - since
+        board[square] = (acting ^ 1, ply)
+
+    end = len(log)
+    for cell in board:
+        if cell:
+            counts[LIFETIME * KINDS + cell[0]] += end - cell[1]
+
+
+def scan_chunk(lines: list[str]) -> Totals:
+    counts = [0] * (len(FIELDS) * KINDS)
+    used = []
+    results = []
+    games = 0
+    for line in lines:
+        record = json.loads(line)
+        log = record.get("log")
+        if log is None:
+            continue
+        games += 1
+        sides = [0] * (2 * KINDS)
+        scan(log, counts, sides)
+        used += sides
+        winner = record["winner"]
+        for side in (0, 1):
+            results.append(0.5 if winner is None else float(winner == side))
+
+    totals = Totals(games=games, samples=len(results))
+    totals.counts += np.array(counts, dtype=np.int64).reshape(len(FIELDS), KINDS)
+    if results:
+        x = np.array(used, dtype=np.float64).reshape(-1, KINDS)
+        y = np.array(results)
+        totals.sx += x.sum(axis=0)
+        totals.sxx += (x * x).sum(axis=0)
+        totals.sxy += y @ x
+        totals.sy = float(y.sum())
+        totals.syy = float(y @ y)
+    return totals
+
+
+def chunks(paths, size: int = CHUNK):
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path)
+        try:
+            while lines := list(islice(f, size)):
+                yield lines
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def analyse(paths, processes=None, size: int = CHUNK) -> Totals:
+    totals = Totals()
+    # the same default as Pool
+    processes = processes or os.cpu_count() or 1
+    with Pool(processes) as pool:
+        # Pool.imap would read the whole input ahead, keep a few chunks in
+        # flight instead
+        window = deque()
+        limit = 2 * processes
+        for lines in chunks(paths, size):
+            window.append(pool.apply_async(scan_chunk, (lines,)))
+            if len(window) >= limit:
+                totals.add(window.popleft().get())
+        while window:
+            totals.add(window.popleft().get())
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="piece balance statistics")
+    parser.add_argument("logs", nargs="+", help="jsonl game records, - for stdin")
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    parser.add_argument("--json", action="store_true", help="print the rows")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    totals = analyse(args.logs, args.processes, args.chunk)
+    elapsed = perf_counter() - start
+    rows = totals.report()
+    if args.json:
+        print(json.dumps({"games": totals.games, "pieces": rows}))
+        sys.exit()
+
+    print(f"{totals.games} games in {elapsed:.1f}s")
+    print(
+        f"{'piece':<12}{'placed':>9}{'spawns/g':>10}{'actions':>10}"
+        f"{'capt/act':>10}{'lost':>9}{'lifetime':>10}{'survival':>10}{'win r':>8}"
+    )
+    for row in rows:
+        name = row["piece"] + ("+" if row["flipped"] else "")
+        captures = row["captures_per_action"]
+        correlation = row["win_correlation"]
+        print(
+            f"{name:<12}{row['placed']:>9}{row['spawns_per_game']:>10.3f}"
+            f"{row['actions']:>10}"
+            f"{'-' if captures is None else f'{captures:.3f}':>10}"
+            f"{row['lost']:>9}{row['mean_lifetime']:>10.1f}{row['survival']:>10.3f}"
+            f"{'-' if correlation is None else f'{correlation:+.3f}':>8}"
+        )
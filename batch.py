@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from board import Board
+from codec import FLIPPED, NAMES, OWN
+from core import calculate_moves
+from piece import PIECES, Piece
+
+# batched move generation over many boards at once, for moves only (strikes
+# and commands come from core.calculate_actions) and the game pieces, which
+# have no shields (only the perft fixture pieces do). every board is seen from
+# the side to move, like core.calculate_moves. batch arrays are indexed
+# [x, y, board] like board.positions[x][y], and move generation runs on them
+# bit packed along the board axis, so one uint64 word carries 64 boards and
+# every ray step is a handful of bitwise operations over whole squares.
+
+SIZE = 6
+SQUARES = SIZE * SIZE
+LANES = 64
+PIECE_NAMES = sorted(PIECES)
+PIECE_TYPES = {name: i for i, name in enumerate(PIECE_NAMES)}
+
+
+@dataclass(slots=True)
+class BoardBatch:
+    occupancy: np.ndarray  # (6, 6, B) bool
+    owner: np.ndarray  # (6, 6, B) bool, True for pieces of the side to move
+    type: np.ndarray  # (6, 6, B) int8 index into PIECE_NAMES
+    flip: np.ndarray  # (6, 6, B) bool
+
+    def __len__(self):
+        return self.occupancy.shape[-1]
+
+
+def encode_boards(boards: list[Board]) -> BoardBatch:
+    n = len(boards)
+    occupancy = np.zeros((SIZE, SIZE, n), dtype=bool)
+    owner = np.zeros((SIZE, SIZE, n), dtype=bool)
+    kind = np.zeros((SIZE, SIZE, n), dtype=np.int8)
+    flip = np.zeros((SIZE, SIZE, n), dtype=bool)
+    for b, board in enumerate(boards):
+        for x, row in enumerate(board.positions):
+            for y, piece in enumerate(row):
+                if piece:
+                    occupancy[x, y, b] = True
+                    owner[x, y, b] = piece.is_own
+                    kind[x, y, b] = PIECE_TYPES[piece.name]
+                    flip[x, y, b] = piece.is_flipped
+    return BoardBatch(occupancy, owner, kind, flip)
+
+
+# codec piece index (low six bits of a packed cell) -> index into PIECE_NAMES
+PACKED_TYPES = np.zeros(64, dtype=np.int8)
+PACKED_TYPES[1 : len(NAMES) + 1] = [PIECE_TYPES[name] for name in NAMES]
+
+
+# the same from codec packed positions, without building boards
+def encode_packed(positions: list[bytes]) -> BoardBatch:
+    codes = np.frombuffer(b"".join(positions), dtype=np.uint8)
+    codes = codes.reshape(-1, SIZE, SIZE).transpose(1, 2, 0)
+    return BoardBatch(
+        codes != 0,
+        (codes & OWN) != 0,
+        PACKED_TYPES[codes & 0x3F],
+        (codes & FLIPPED) != 0,
+    )
+
+
+# packs the last (board) axis into uint64 words, padding to whole words
+def pack(array: np.ndarray) -> np.ndarray:
+    pad = -array.shape[-1] % LANES
+    if pad:
+        widths = [(0, 0)] * (array.ndim - 1) + [(0, pad)]
+        array = np.pad(array, widths)
+    return np.packbits(array, axis=-1, bitorder="little").view(np.uint64)
+
+
+def unpack(words: np.ndarray, n: int) -> np.ndarray:
+    bits = np.unpackbits(words.view(np.uint8), axis=-1, bitorder="little")
+    return bits[..., :n].astype(bool)
+
+
+# source and target slices of one axis for an offset, None if off the board
+def axis_slices(offset):
+    if abs(offset) >= SIZE:
+        return None
+    if offset >= 0:
+        return slice(0, SIZE - offset), slice(offset, SIZE)
+    return slice(-offset, SIZE), slice(0, SIZE + offset)
+
+
+def movement(move) -> bool:
+    return not (move.is_strike or move.is_command or move.is_shield)
+
+
+def build_tables():
+    vectors = []
+    for name in PIECE_NAMES:
+        piece = Piece(name)
+        for move in piece.normal_moves + piece.flipped_moves:
+            vector = (move.dx, move.dy, move.is_slide, move.is_jump)
+            if movement(move) and vector not in vectors:
+                vectors.append(vector)
+
+    # has_move[type, flip, vector]
+    has_move = np.zeros((len(PIECE_NAMES), 2, len(vectors)), dtype=bool)
+    for t, name in enumerate(PIECE_NAMES):
+        piece = Piece(name)
+        for f, moves in enumerate((piece.normal_moves, piece.flipped_moves)):
+            for move in moves:
+                if movement(move):
+                    vector = (move.dx, move.dy, move.is_slide, move.is_jump)
+                    has_move[t, f, vectors.index(vector)] = True
+
+    # rays[vector] is a list of (offset index, source, target), one per step,
+    # where source and target are 2d slices of the board. steps that are only
+    # passed over (the path of a plain two square move) have no offset index
+    offsets = []
+    rays = []
+    for dx, dy, is_slide, is_jump in vectors:
+        distance = max(abs(dx), abs(dy))
+        if is_slide:
+            steps = [(dx * d, dy * d, True) for d in range(1, SIZE)]
+        elif is_jump:
+            steps = [(dx, dy, True)]
+        else:
+            ux, uy = dx // distance, dy // distance
+            steps = [(ux * d, uy * d, d == distance) for d in range(1, distance + 1)]
+        ray = []
+        for ox, oy, is_target in steps:
+            xs = axis_slices(ox)
+            ys = axis_slices(oy)
+            if xs is None or ys is None:
+                break
+            o = None
+            if is_target:
+                if (ox, oy) not in offsets:
+                    offsets.append((ox, oy))
+                o = offsets.index((ox, oy))
+            ray.append((o, (xs[0], ys[0]), (xs[1], ys[1])))
+        rays.append(ray)
+    return vectors, has_move, offsets, rays
+
+
+VECTORS, HAS_MOVE, OFFSETS, RAYS = build_tables()
+
+
+# packed masks shaped (len(OFFSETS), 6, 6, words): bit b of [o, x, y] is set
+# when the piece on (x, y) of board b may move by OFFSETS[o]
+def legal_moves(batch: BoardBatch) -> np.ndarray:
+    own = batch.occupancy & batch.owner
+    occupied = pack(batch.occupancy)
+    free = ~pack(own)
+    empty = ~occupied
+
+    # one packed plane of own pieces per piece type and flip side
+    planes = {}
+    for t in range(len(PIECE_NAMES)):
+        of_type = own & (batch.type == t)
+        for f, flipped in enumerate((~batch.flip, batch.flip)):
+            if HAS_MOVE[t, f].any():
+                planes[t, f] = pack(of_type & flipped)
+
+    masks = np.zeros((len(OFFSETS),) + occupied.shape, dtype=np.uint64)
+    for v, ray in enumerate(RAYS):
+        running = np.zeros_like(occupied)
+        for (t, f), plane in planes.items():
+            if HAS_MOVE[t, f, v]:
+                running |= plane
+        # a jump slide keeps going over pieces
+        passes = VECTORS[v][2] and VECTORS[v][3]
+        for o, (sx, sy), (tx, ty) in ray:
+            step = running[sx, sy]
+            if o is not None:
+                masks[o][sx, sy] |= step & free[tx, ty]
+            if not passes:
+                running[sx, sy] = step & empty[tx, ty]
+
+    return masks
+
+
+def count_moves(masks: np.ndarray) -> int:
+    return int(np.bitwise_count(masks).sum())
+
+
+# expands packed masks to (B, 6, 6, 6, 6) bools indexed [board, px, py, x, y]
+def to_mask(masks: np.ndarray, n: int) -> np.ndarray:
+    bits = unpack(masks, n)
+    mask = np.zeros((n, SIZE, SIZE, SIZE, SIZE), dtype=bool)
+    for o, (ox, oy) in enumerate(OFFSETS):
+        for x in range(SIZE):
+            for y in range(SIZE):
+                tx = x + ox
+                ty = y + oy
+                if 0 <= tx < SIZE and 0 <= ty < SIZE:
+                    mask[:, x, y, tx, ty] |= bits[o, x, y]
+    return mask
+
+
+def random_board(rng: random.Random, max_pieces: int = 8) -> Board:
+    board = Board()
+    squares = rng.sample(range(SQUARES), rng.randint(2, max_pieces))
+    for i, square in enumerate(squares):
+        if i < 2:
+            name = "duke"
+        else:
+            name = rng.choice([name for name in PIECE_NAMES if name != "duke"])
+        piece = Piece(name, is_own=i % 2 == 0, is_flipped=rng.random() < 0.5)
+        board.place_piece(square // SIZE, square % SIZE, piece)
+    return board
+
+
+def random_boards(n: int, seed: int = 0) -> list[Board]:
+    rng = random.Random(seed)
+    return [random_board(rng) for _ in range(n)]
+
+
+# compares every mask against the scalar generator
+def check(boards: list[Board]) -> list[str]:
+    errors = []
+    mask = to_mask(legal_moves(encode_boards(boards)), len(boards))
+    for b, board in enumerate(boards):
+        for x, row in enumerate(board.positions):
+            for y, piece in enumerate(row):
+                if piece and piece.is_own:
+                    expected = set(calculate_moves(x, y, piece, board))
+                else:
+                    expected = set()
+                got = {tuple(pos) for pos in np.argwhere(mask[b, x, y])}
+                if got != expected:
+                    errors.append(f"board {b} square {x},{y}: {got} != {expected}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="batched move generation check")
+    parser.add_argument("-n", "--boards", type=int, default=2000)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    errors = check(random_boards(args.boards, args.seed))
+    for error in errors[:20]:
+        print(error)
+    print("batch ok" if not errors else f"batch failed ({len(errors)})")
+    sys.exit(1 if errors else 0)
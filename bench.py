@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tracemalloc
+from time import perf_counter, sleep
+
+import perft
+from core import (
+    cached_moves,
+    cached_spawn_positions,
+    calculate_moves,
+    calculate_spawn_positions,
+)
+from piece import Piece
+
+# python bench.py                        run perft checks then every benchmark
+#                                        (footprints only run when named)
+# python bench.py moves spawn            run only the named benchmarks
+# python bench.py --save base.json       store the results as a baseline
+# python bench.py --compare base.json    print the change against a baseline
+# python bench.py idle_connections --connections 1000
+
+BENCHMARKS = {}
+# benchmarks that measure a footprint once instead of timing calls, they
+# return their results. they start servers and open sockets, so they only
+# run when named
+FOOTPRINTS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def footprint(func):
+    FOOTPRINTS[func.__name__] = func
+    return func
+
+
+def own_pieces(board):
+    return [
+        (x, y, piece)
+        for x, row in enumerate(board.positions)
+        for y, piece in enumerate(row)
+        if piece and piece.is_own
+    ]
+
+
+# every benchmark returns a callable that does one unit of work and returns
+# the number of nodes (generated squares or visited positions) it produced
+
+
+@benchmark
+def moves():
+    board = perft.load(perft.POSITIONS["midgame"]).board
+    pieces = own_pieces(board)
+
+    def run():
+        nodes = 0
+        for x, y, piece in pieces:
+            nodes += len(calculate_moves(x, y, piece, board))
+        return nodes
+
+    return run
+
+
+@benchmark
+def spawn():
+    board = perft.load(perft.POSITIONS["setup"]).board
+    piece = Piece("seer")
+
+    def run():
+        return len(calculate_spawn_positions(piece, board))
+
+    return run
+
+
+# what an idle frame pays once the board cache is warm
+@benchmark
+def cached_frame():
+    board = perft.load(perft.POSITIONS["midgame"]).board
+    pieces = own_pieces(board)
+    piece = Piece("seer")
+
+    def run():
+        nodes = len(cached_spawn_positions(piece, board))
+        for x, y, _ in pieces:
+            nodes += len(cached_moves(x, y, board))
+        return nodes
+
+    return run
+
+
+@benchmark
+def batch_moves():
+    import batch
+
+    if batch.check(batch.random_boards(256)):
+        sys.exit("batched move generation differs from calculate_moves")
+    encoded = batch.encode_boards(batch.random_boards(4096))
+
+    def run():
+        return batch.count_moves(batch.legal_moves(encoded))
+
+    return run
+
+
+# one node is one position encoded and decoded again
+@benchmark
+def codec_text():
+    import codec
+
+    board = perft.load(perft.POSITIONS["midgame"]).board
+
+    def run():
+        codec.decode(codec.encode(board))
+        return 1
+
+    return run
+
+
+@benchmark
+def codec_binary():
+    import codec
+
+    board = perft.load(perft.POSITIONS["midgame"]).board
+
+    def run():
+        codec.unpack(codec.pack(board))
+        return 1
+
+    return run
+
+
+@benchmark
+def perft_setup():
+    position = perft.POSITIONS["setup"]
+
+    def run():
+        return perft.load(position).count(3)
+
+    return run
+
+
+def rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+# server memory per idle lobby connection. a server runs in a subprocess and
+# every connection asks for its uid once, so it is registered and has been
+# through dispatch. both ends hold one descriptor per connection, the count
+# is capped by the open file limit
+@footprint
+def idle_connections(count: int):
+    import resource
+    import socket
+    import subprocess
+    from pathlib import Path
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    count = min(count, hard - 128)
+
+    with socket.socket() as probe:
+        probe.bind(("localhost", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen(
+        # a benchmark server keeps its hands off the real ratings
+        [sys.executable, "server.py", "--port", str(port), "--ratings", ""],
+        cwd=Path(__file__).parent,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+    )
+
+    def connect(i):
+        # one local source address per 20k connections, the ephemeral port
+        # range would run out on a single one
+        return socket.create_connection(
+            ("localhost", port), source_address=(f"127.0.0.{2 + i // 20000}", 0)
+        )
+
+    def handshake(batch):
+        for sock in batch:
+            sock.sendall(b"uid:|")
+        for sock in batch:
+            sock.recv(64)
+
+    connections = []
+    try:
+        for _ in range(100):
+            try:
+                connections.append(connect(0))
+                break
+            except ConnectionRefusedError:
+                sleep(0.05)
+        else:
+            sys.exit("the benchmark server did not start")
+        handshake(connections)
+        before = rss(server.pid)
+        start = perf_counter()
+        for first in range(1, count, 1000):
+            batch = [connect(i) for i in range(first, min(first + 1000, count))]
+            handshake(batch)
+            connections += batch
+        elapsed = perf_counter() - start
+        sleep(0.2)
+        after = rss(server.pid)
+    finally:
+        for sock in connections:
+            sock.close()
+        server.kill()
+        server.wait()
+
+    opened = len(connections) - 1
+    return {
+        "connections": opened,
+        "connects/s": opened / elapsed,
+        "server bytes/connection": (after - before) / opened,
+    }
+
+
+def measure(run, min_time: float) -> dict[str, float]:
+    calls = 0
+    nodes = 0
+    start = perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        nodes += run()
+        calls += 1
+        elapsed = perf_counter() - start
+
+    # the temporaries of a call are freed before it returns, so only the
+    # peak shows them
+    tracemalloc.start()
+    run()
+    before_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "calls/s": calls / elapsed,
+        "nodes/s": nodes / elapsed,
+        "peak bytes/call": peak - before_size,
+    }
+
+
+def report(results, baseline=None):
+    for name, stats in results.items():
+        line = [f"{name:<16}"]
+        for key, value in stats.items():
+            entry = f"{key} {value:>12,.0f}"
+            if baseline and name in baseline and baseline[name].get(key):
+                change = (value - baseline[name][key]) / baseline[name][key] * 100
+                entry += f" ({change:+.1f}%)"
+            line.append(entry)
+        print("  ".join(line))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="move generation benchmarks")
+    parser.add_argument("names", nargs="*")
+    parser.add_argument("-t", "--time", type=float, default=0.5)
+    parser.add_argument("--save", default=None)
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--skip-perft", action="store_true")
+    parser.add_argument("--connections", type=int, default=100_000)
+    args = parser.parse_args()
+
+    if not args.skip_perft:
+        errors = perft.verify()
+        if errors:
+            for error in errors:
+                print(error)
+            sys.exit("perft failed, refusing to benchmark a broken move generator")
+
+    results = {}
+    for name in args.names or BENCHMARKS:
+        if name in FOOTPRINTS:
+            results[name] = FOOTPRINTS[name](args.connections)
+        else:
+            results[name] = measure(BENCHMARKS[name](), args.time)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
@@ -2,8 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 
-import pyxel
-
+from codec import own_only, pack, to_text, unpack
 from piece import Piece
 
 TILE = 32
@@ -19,33 +18,81 @@ class Board:
     cols: int = 6
     line_length = rows * TILE
     positions: list[Piece] = field(default_factory=gen_board)
+    # bumped on every mutation, cache holds move generation results for it
+    version: int = 0
+    cache: dict = field(default_factory=dict)
 
+    # own pieces in the text form of codec.py
     @property
     def piece_positions(self):
-        msg = ""
-        for x in range(self.rows):
-            for y in range(self.cols):
-                if piece := self.positions[x][y]:
-                    if piece.is_own:
-                        msg += (
-                            f"{piece.name} {x},{y},{'f' if piece.is_flipped else ''}-"
-                        )
-
-        return msg[:-1]
+        return to_text(own_only(self.snapshot()))
 
     @property
     def duke_position(self):
+        if "duke" in self.cache:
+            return self.cache["duke"]
+        self.cache["duke"] = None
         for x in range(self.rows):
             for y in range(self.cols):
                 if piece := self.positions[x][y]:
                     if piece.tag == "DUKE" and piece.is_own:
+                        self.cache["duke"] = (x, y)
                         return (x, y)
 
     def get_piece(self, x, y) -> Piece:
         return self.positions[x][y]
 
+    # packed position (see codec.py), restore puts it back. it is cached until
+    # the next change so it doubles as a key for position caches
+    def snapshot(self) -> bytes:
+        if "packed" not in self.cache:
+            self.cache["packed"] = pack(self)
+        return self.cache["packed"]
+
+    def restore(self, snapshot: bytes):
+        cells = [
+            cell and Piece(cell[0], is_own=cell[1], is_flipped=cell[2])
+            for cell in unpack(snapshot)
+        ]
+        self.positions = [
+            cells[x * self.cols : (x + 1) * self.cols] for x in range(self.rows)
+        ]
+        self.touch()
+
+    def touch(self):
+        self.version += 1
+        self.cache.clear()
+
     def place_piece(self, x, y, piece):
         self.positions[x][y] = piece
+        self.touch()
+
+    def move_piece(self, px, py, x, y):
+        self.positions[x][y] = self.positions[px][py].flip()
+        self.positions[px][py] = None
+        self.touch()
+
+    # moves without flipping, for commanded pieces
+    def shift_piece(self, px, py, x, y):
+        self.positions[x][y] = self.positions[px][py]
+        self.positions[px][py] = None
+        self.touch()
+
+    def flip_piece(self, x, y):
+        self.positions[x][y].flip()
+        self.touch()
+
+    # rotates the board and hands it over to the other player
+    def swap_sides(self):
+        cells = [piece for row in self.positions for piece in row]
+        cells.reverse()
+        for piece in cells:
+            if piece:
+                piece.is_own = not piece.is_own
+        self.positions = [
+            cells[x * self.cols : (x + 1) * self.cols] for x in range(self.rows)
+        ]
+        self.touch()
 
     def clear_opponent(self):
         for x in range(self.rows):
@@ -53,45 +100,28 @@ class Board:
                 if piece := self.positions[x][y]:
                     if not piece.is_own:
                         self.positions[x][y] = None
+        self.touch()
 
     def update_opponent(self, pieces: list[Piece]):
         self.clear_opponent()
         for pos, piece in pieces.items():
             x, y = pos
             self.positions[5 - x][5 - y] = piece
+        self.touch()
 
     def move_opponent(self, move: str):
         raw_pre, raw_after = move.split("->")
         px, py = [int(v) for v in raw_pre.split(",")]
         x, y = [int(v) for v in raw_after.split(",")]
-        self.positions[5 - x][5 - y] = self.positions[5 - px][5 - py].flip()
-        self.positions[5 - px][5 - py] = None
+        self.move_piece(5 - px, 5 - py, 5 - x, 5 - y)
 
     def spawn_opponent(self, move: str):
-        print(move)
         piece_name, raw_pos = move.split("->")
         x, y = [int(v) for v in raw_pos.split(",")]
-        self.positions[5 - x][5 - y] = Piece(piece_name, is_own=False)
-
-    def draw_pieces(self):
-        for x, row in enumerate(self.positions):
-            for y, piece in enumerate(row):
-                if piece:
-                    piece.draw(x, y)
+        self.place_piece(5 - x, 5 - y, Piece(piece_name, is_own=False))
 
+    # rendering lives in render.py so headless users never import pyxel
     def draw(self):
-        t = TILE
-        ln = self.line_length
-        nr = self.rows
-        nc = self.cols
-        dblue = pyxel.COLOR_DARK_BLUE
-        for r in range(self.rows):
-            for c in range(self.cols):
-                # row
-                pyxel.line(r * t, c * t, r * t, ln, dblue)
-                # col
-                pyxel.line(r * t, c * t, ln, c * t, dblue)
-        pyxel.line(nr * t, 0, ln, nc * t, dblue)
-        pyxel.line(0, nc * t, nr * t, ln, dblue)
-
-        self.draw_pieces()
+        from render import draw_board
+
+        draw_board(self)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import random
+import struct
+import sys
+from collections import defaultdict
+from time import perf_counter
+
+from board import Board
+from codec import NAMES
+from piece import Piece
+
+# opening book built from simulate.py logs. positions are keyed by a zobrist
+# hash of the packed board (seen from the side to move) and the piece in hand,
+# so setup placements and spawns get their own entries. every book move keeps
+# how many games played it and how they ended for the side that played it.
+#
+# moves are packed into 16 bits:
+#
+#   0..1295      move from square a to b as a * 36 + b (square = x * 6 + y)
+#   1296..1331   place the piece in hand on square 1296 + s
+#   1332         draw from the bag
+#
+# file: header, an open addressing table of positions, then their moves
+#
+#   "DUKEBK01" seed:u64 capacity:u32 positions:u32 moves:u32 names_length:u16
+#   names(utf-8, comma separated)
+#   capacity x (key:u64 first:u32 count:u32)       key 0 is an empty slot
+#   moves x (move:u16 games:u32 wins:u32 draws:u32)
+
+MAGIC = b"DUKEBK01"
+HEADER = struct.Struct("<8sQIIIH")
+SLOT = struct.Struct("<QII")
+MOVE = struct.Struct("<HIII")
+SEED = 0x0D0CE
+
+PLACE = 1296
+DRAW = 1332
+DEPTH = 16
+
+zobrist_rng = random.Random(SEED)
+# one key per packed cell code and square, and one per piece in hand
+ZOBRIST = [[zobrist_rng.getrandbits(64) for _ in range(256)] for _ in range(36)]
+HAND = {name: zobrist_rng.getrandbits(64) for name in NAMES}
+
+
+def position_key(data: bytes, in_hand: str = None) -> int:
+    key = HAND[in_hand] if in_hand else 0
+    for square, code in enumerate(data):
+        if code:
+            key ^= ZOBRIST[square][code]
+    # 0 marks an empty slot on disk
+    return key or 1
+
+
+def encode_action(action) -> int:
+    match action:
+        case ("move", px, py, x, y):
+            return (px * 6 + py) * 36 + x * 6 + y
+        case ("place", _, x, y):
+            return PLACE + x * 6 + y
+        case ("draw",):
+            return DRAW
+    raise ValueError(f"cannot store {action} in the book")
+
+
+def decode_action(move: int, in_hand: str = None):
+    if move == DRAW:
+        return ("draw",)
+    if move >= PLACE:
+        return ("place", in_hand, *divmod(move - PLACE, 6))
+    return ("move", *divmod(move // 36, 6), *divmod(move % 36, 6))
+
+
+# (key, move) -> [games, wins, draws], from the first depth log entries
+def collect(records, depth: int = DEPTH) -> dict[tuple[int, int], list[int]]:
+    stats = defaultdict(lambda: [0, 0, 0])
+
+    def add(side, key, move):
+        entry = stats[key, move]
+        entry[0] += 1
+        if winner == side:
+            entry[1] += 1
+        elif winner is None:
+            entry[2] += 1
+
+    for record in records:
+        winner = record["winner"]
+        board = Board()
+        side = None
+        for entry in record["log"][:depth]:
+            if side is not None and entry[0] != side:
+                board.swap_sides()
+            side = entry[0]
+            match entry:
+                case [_, "p", name, x, y]:
+                    place = encode_action(("place", name, x, y))
+                    add(side, position_key(board.snapshot(), name), place)
+                    board.place_piece(x, y, Piece(name))
+                case [_, "s", name, x, y]:
+                    place = encode_action(("place", name, x, y))
+                    add(side, position_key(board.snapshot()), DRAW)
+                    add(side, position_key(board.snapshot(), name), place)
+                    board.place_piece(x, y, Piece(name))
+                case [_, "m", px, py, x, y, *_]:
+                    move = encode_action(("move", px, py, x, y))
+                    add(side, position_key(board.snapshot()), move)
+                    board.move_piece(px, py, x, y)
+                case _:
+                    # strikes and commands are not book moves
+                    break
+    return stats
+
+
+def write(path, stats: dict[tuple[int, int], list[int]]):
+    positions = defaultdict(list)
+    for (key, move), entry in stats.items():
+        positions[key].append((move, *entry))
+
+    capacity = 1
+    while capacity < len(positions) * 2:
+        capacity *= 2
+    mask = capacity - 1
+    slots = [(0, 0, 0)] * capacity
+    moves = []
+    for key, entries in positions.items():
+        i = key & mask
+        while slots[i][0]:
+            i = (i + 1) & mask
+        slots[i] = (key, len(moves), len(entries))
+        moves.extend(sorted(entries))
+
+    names = ",".join(NAMES).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(
+            HEADER.pack(MAGIC, SEED, capacity, len(positions), len(moves), len(names))
+        )
+        f.write(names)
+        f.write(b"".join(SLOT.pack(*slot) for slot in slots))
+        f.write(b"".join(MOVE.pack(*move) for move in moves))
+
+
+class Book:
+    __slots__ = ("file", "data", "mask", "slots", "moves")
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, seed, capacity, _, _, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC or seed != SEED:
+            raise ValueError(f"{path} is not an opening book for these keys")
+        names = bytes(self.data[HEADER.size : HEADER.size + length]).decode("utf-8")
+        if names.split(",") != NAMES:
+            raise ValueError(f"{path} was built for pieces {names}")
+        self.mask = capacity - 1
+        self.slots = HEADER.size + length
+        self.moves = self.slots + capacity * SLOT.size
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # [(move, games, wins, draws)] for a position key
+    def lookup(self, key: int) -> list[tuple[int, int, int, int]]:
+        i = key & self.mask
+        while True:
+            slot_key, first, count = SLOT.unpack_from(
+                self.data, self.slots + i * SLOT.size
+            )
+            if slot_key == key:
+                start = self.moves + first * MOVE.size
+                return [
+                    MOVE.unpack_from(self.data, start + j * MOVE.size)
+                    for j in range(count)
+                ]
+            if not slot_key:
+                return []
+            i = (i + 1) & self.mask
+
+    # [(action, games, wins, draws)] for the side to move
+    def probe(self, board: Board, in_hand: str = None):
+        key = position_key(board.snapshot(), in_hand)
+        return [
+            (decode_action(move, in_hand), games, wins, draws)
+            for move, games, wins, draws in self.lookup(key)
+        ]
+
+
+def read_records(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build the opening book")
+    parser.add_argument("logs", nargs="+", help="simulate.py jsonl output")
+    parser.add_argument("-d", "--depth", type=int, default=DEPTH)
+    parser.add_argument("--min-games", type=int, default=1)
+    parser.add_argument("-o", "--out", default="opening.book")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    stats = collect(read_records(args.logs), args.depth)
+    kept = {key: entry for key, entry in stats.items() if entry[0] >= args.min_games}
+    if not kept:
+        sys.exit("no positions to write")
+    write(args.out, kept)
+    print(
+        f"{len({key for key, _ in kept})} positions, {len(kept)} moves "
+        f"in {perf_counter() - start:.1f}s"
+    )
@@ -0,0 +1,514 @@
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+from collections import Counter
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from queue import Empty, SimpleQueue
+from random import Random
+from statistics import median
+from threading import Thread
+from time import monotonic
+from typing import Any
+
+import numpy as np
+
+from batch import PIECE_NAMES, BoardBatch, encode_packed, legal_moves, to_mask
+from board import Board
+from client import make_decorator
+from core import (
+    calculate_moves,
+    calculate_spawn_positions,
+    decode_opponent_piece_positions,
+)
+from piece import Piece
+from player import Player
+from policies import greedy
+from session import Loop, Session
+
+# bot players. a bot is an ordinary client on a Session: it joins a room, sets
+# up and plays over the same messages as the pyxel client, so the server
+# relays and numbers its turns like anyone else's. the server plays its bots
+# in a process of their own (BotProcess) and passes that process the far end
+# of a socketpair per bot (Server.add_bot), so bot games never hold the GIL
+# of the thread that serves people. bots.py on its own plays bots against a
+# server as a load test.
+#
+# a BotHost serves all of its bots on one Loop in its own thread. a bot to
+# move files a request, the host batches the requests of every game into one
+# evaluation on a process pool and plays the answers. a request that is not
+# answered within the move budget is played by the greedy policy instead.
+#
+# the evaluation looks two plies deep for every position at once: all moves
+# from batch.legal_moves, every position after them, and all the replies to
+# those from a second legal_moves call. a move scores what it takes minus the
+# most the reply can take back, taking the duke wins outright.
+
+TICK = 0.005
+BATCH = 256
+# how long the first request of a batch waits for company
+WINDOW = 0.01
+BUDGET = 0.25
+MAX_TURNS = 300
+SPAWN_CHANCE = 0.3
+# scheduling priority of the bot process below the server
+NICE = 10
+
+WIN = 1000.0
+VALUES = {"duke": 100, "foot": 1}
+VALUE = np.array([VALUES.get(name, 3) for name in PIECE_NAMES])
+DUKE = PIECE_NAMES.index("duke")
+
+noise = np.random.default_rng()
+
+
+# best move and its score for every packed position, seen from the side to
+# move. positions without a move get (None, -WIN)
+def evaluate(positions: list[bytes]) -> list[tuple[tuple | None, float]]:
+    n = len(positions)
+    results = [(None, -WIN)] * n
+    parents = encode_packed(positions)
+    moves = np.argwhere(to_mask(legal_moves(parents), n))
+    if not len(moves):
+        return results
+
+    b, px, py, x, y = moves.T
+    k = np.arange(len(moves))
+    # one copy of the position per move, indexed [x, y, move]
+    occupancy = parents.occupancy[:, :, b]
+    owner = parents.owner[:, :, b]
+    kind = parents.type[:, :, b]
+    flip = parents.flip[:, :, b]
+
+    taken = occupancy[x, y, k]
+    wins = taken & (kind[x, y, k] == DUKE)
+    gain = np.where(taken, VALUE[kind[x, y, k]], 0)
+
+    # the mover lands flipped
+    kind[x, y, k] = kind[px, py, k]
+    flip[x, y, k] = ~flip[px, py, k]
+    occupancy[x, y, k] = True
+    owner[x, y, k] = True
+    occupancy[px, py, k] = False
+    owner[px, py, k] = False
+
+    # the same positions from the other side
+    occupancy = occupancy[::-1, ::-1]
+    ours = occupancy & owner[::-1, ::-1]
+    replies = BoardBatch(
+        occupancy, ~ours & occupancy, kind[::-1, ::-1], flip[::-1, ::-1]
+    )
+    reach = to_mask(legal_moves(replies), len(moves)).any(axis=(1, 2))
+    attacked = reach.transpose(1, 2, 0) & ours
+    loss = np.where(attacked, VALUE[replies.type], 0).max(axis=(0, 1))
+
+    scores = np.where(wins, WIN, gain - loss) + noise.random(len(moves)) * 0.1
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    for start, end in zip(starts, np.r_[starts[1:], len(moves)]):
+        best = start + int(np.argmax(scores[start:end]))
+        action = ("move", *(int(v) for v in moves[best, 1:]))
+        results[b[start]] = (action, float(scores[best]))
+    return results
+
+
+def quick_action(board: Board, rng: Random):
+    actions = [
+        ("move", x, y, tx, ty)
+        for x, row in enumerate(board.positions)
+        for y, piece in enumerate(row)
+        if piece and piece.is_own
+        for tx, ty in calculate_moves(x, y, piece, board)
+    ]
+    return greedy(board, actions, rng) if actions else None
+
+
+# handlers are bound per bot session like main.py binds them to the game
+HANDLERS = []
+
+
+def handle(func):
+    HANDLERS.append(func)
+    return func
+
+
+def register(bot: Bot, session: Session):
+    bind = make_decorator(bot, session)
+    for func in HANDLERS:
+        bind(func)
+
+
+@dataclass(slots=True)
+class Bot:
+    host: BotHost
+    session: Session
+    room: str
+    # asks the server for a bot opponent once in the room
+    challenge: bool = False
+    rng: Random = field(default_factory=Random)
+    board: Board = field(default_factory=Board)
+    player: Player = field(default_factory=Player)
+    opponent_setup: dict = None
+    is_set_up: bool = False
+    # same turn numbering as Game
+    seq: int = 0
+    pending: int = None
+    confirmed: tuple[bytes, list[str]] = None
+    result: str = None
+
+    # a peer that went away closes the bot, the server drops a bot once its
+    # room has nobody else in it
+    def send(self, msg: str, meta: dict = None):
+        try:
+            self.session.send(msg, meta)
+        except OSError:
+            self.host.close(self)
+
+    def join(self):
+        self.send(f"room:{self.room}")
+
+    def setup(self):
+        player = self.player
+        while player.initial_pieces:
+            piece = player.get_initial_piece()
+            squares = sorted(calculate_spawn_positions(piece, self.board))
+            self.board.place_piece(*self.rng.choice(squares), piece)
+        self.send(f"positions:{self.board.piece_positions}")
+        self.is_set_up = True
+        self.get_ready()
+
+    def get_ready(self):
+        if self.is_set_up and self.opponent_setup is not None:
+            self.board.update_opponent(self.opponent_setup)
+            self.player.give_pieces(["seer", "priest"])
+            self.confirm()
+            self.send("ready:")
+
+    def confirm(self, seq: int = None):
+        if seq is not None:
+            self.seq = seq
+        self.pending = None
+        self.confirmed = (self.board.snapshot(), [p.name for p in self.player.bag])
+
+    def rollback(self):
+        board, bag = self.confirmed
+        self.board.restore(board)
+        self.player.bag = [Piece(name) for name in bag]
+        self.pending = None
+
+    def turn(self):
+        if self.result:
+            return
+        if not self.board.duke_position or self.seq >= MAX_TURNS:
+            self.send("lost:")
+            return
+        self.host.request(self)
+
+    # plays the evaluated move, or draws a piece when the move wins nothing
+    def decide(self, action, score: float):
+        board = self.board
+        bag = self.player.bag
+        if bag and calculate_spawn_positions(bag[0], board):
+            if action is None or (score < 1 and self.rng.random() < SPAWN_CHANCE):
+                piece = self.player.pull_piece()
+                squares = sorted(calculate_spawn_positions(piece, board))
+                x, y = self.rng.choice(squares)
+                board.place_piece(x, y, piece)
+                self.play(f"spawn_opponent:{piece.name}->{x},{y}")
+                return
+        if action is None:
+            self.send("lost:")
+            return
+        _, px, py, x, y = action
+        board.move_piece(px, py, x, y)
+        self.play(f"move:{px},{py}->{x},{y}")
+
+    def play(self, msg: str):
+        self.pending = self.seq + 1
+        self.send(msg, {"seq": self.pending})
+
+    def finish(self, result: str):
+        self.result = result
+        self.send("exit_room:")
+        self.host.close(self)
+
+
+@handle
+def room(bot: Bot, session: Session, data: str):
+    if bot.challenge:
+        bot.send("bot:")
+
+
+@handle
+def info(bot: Bot, session: Session, data: str):
+    if data == "room is full":
+        bot.host.close(bot)
+
+
+@handle
+def room_ready(bot: Bot, session: Session, data: str):
+    bot.setup()
+
+
+@handle
+def positions(bot: Bot, session: Session, data: str):
+    bot.opponent_setup = decode_opponent_piece_positions(data)
+    bot.get_ready()
+
+
+@handle
+def move(bot: Bot, session: Session, data: str):
+    if data:
+        bot.board.move_opponent(data)
+        bot.confirm(int(session.meta.get("seq", bot.seq + 1)))
+    bot.turn()
+
+
+@handle
+def spawn_opponent(bot: Bot, session: Session, data: str):
+    bot.board.spawn_opponent(data)
+    bot.confirm(int(session.meta.get("seq", bot.seq + 1)))
+    bot.turn()
+
+
+@handle
+def ack(bot: Bot, session: Session, seq: str):
+    if bot.pending == int(seq):
+        bot.confirm(int(seq))
+
+
+@handle
+def reject(bot: Bot, session: Session, seq: str):
+    if seq and bot.pending == int(seq):
+        bot.rollback()
+
+
+@handle
+def won(bot: Bot, session: Session, data: str):
+    bot.finish("won")
+
+
+@handle
+def lost(bot: Bot, session: Session, data: str):
+    bot.finish("lost")
+
+
+# the server went away
+@handle
+def closed(bot: Bot, session: Session, data: str):
+    bot.host.forget(bot)
+
+
+@dataclass(slots=True)
+class Request:
+    bot: Bot
+    seq: int
+    deadline: float
+    done: bool = False
+
+    @property
+    def is_open(self):
+        bot = self.bot
+        return not (
+            self.done or bot.result or bot.pending is not None or bot.seq != self.seq
+        )
+
+
+@dataclass(slots=True)
+class BotHost:
+    # evaluation processes, 0 evaluates on the host thread
+    workers: int = 1
+    budget: float = BUDGET
+    loop: Loop = field(default_factory=Loop)
+    pool: Any = None
+    # (conn, room, challenge) handed in from other threads
+    incoming: SimpleQueue = field(default_factory=SimpleQueue)
+    bots: dict[int, Bot] = field(default_factory=dict)
+    requests: list[Request] = field(default_factory=list)
+    flights: list[tuple[Any, list[Request]]] = field(default_factory=list)
+    seed: Random = field(default_factory=Random)
+    # totals, read by whoever wants to report them
+    admitted: int = 0
+    results: Counter = field(default_factory=Counter)
+    evaluated: int = 0
+    fallbacks: int = 0
+
+    def start(self) -> BotHost:
+        if self.workers:
+            # spawned, the host process runs threads
+            self.pool = get_context("spawn").Pool(self.workers)
+        Thread(target=self.run, daemon=True).start()
+        return self
+
+    # safe from any thread, the bot joins the room from the host thread
+    def add(self, conn: socket.socket, room: str, challenge: bool = False):
+        self.incoming.put((conn, room, challenge))
+
+    def admit(self):
+        while True:
+            try:
+                conn, room, challenge = self.incoming.get_nowait()
+            except Empty:
+                return
+            session = self.loop.open(Session(conn=conn))
+            bot = Bot(self, session, room, challenge, Random(self.seed.random()))
+            session.owner = bot
+            register(bot, session)
+            self.bots[id(bot)] = bot
+            self.admitted += 1
+            bot.join()
+
+    def forget(self, bot: Bot):
+        if self.bots.pop(id(bot), None):
+            self.results[bot.result or "dropped"] += 1
+
+    def close(self, bot: Bot):
+        self.forget(bot)
+        self.loop.close(bot.session)
+
+    def request(self, bot: Bot):
+        self.requests.append(Request(bot, bot.seq, monotonic() + self.budget))
+
+    def schedule(self):
+        requests = self.requests
+        if not requests or len(self.flights) >= 2 * max(self.workers, 1):
+            return
+        waited = monotonic() - (requests[0].deadline - self.budget)
+        if len(requests) < BATCH and waited < WINDOW:
+            return
+        batch, self.requests = requests[:BATCH], requests[BATCH:]
+        positions = [request.bot.board.snapshot() for request in batch]
+        if self.pool:
+            self.flights.append((self.pool.apply_async(evaluate, (positions,)), batch))
+        else:
+            self.answer(batch, evaluate(positions))
+
+    def answer(self, batch: list[Request], results):
+        for request, (action, score) in zip(batch, results):
+            if request.is_open:
+                request.done = True
+                self.evaluated += 1
+                request.bot.decide(action, score)
+
+    def collect(self):
+        for flight in [flight for flight in self.flights if flight[0].ready()]:
+            self.flights.remove(flight)
+            self.answer(flight[1], flight[0].get())
+
+        # over the budget, waiting or in flight
+        now = monotonic()
+        waiting = self.requests + [r for _, batch in self.flights for r in batch]
+        for request in waiting:
+            if request.is_open and now >= request.deadline:
+                request.done = True
+                self.fallbacks += 1
+                bot = request.bot
+                bot.decide(quick_action(bot.board, bot.rng), 0.0)
+        self.requests = [request for request in self.requests if request.is_open]
+
+    def run(self):
+        while True:
+            # one thread plays every bot, a bad message must not stop it
+            try:
+                self.loop.step(TICK)
+                self.admit()
+                self.schedule()
+                self.collect()
+            except Exception as e:
+                print(f"bot host error: {e!r}")
+
+
+# runs in the bot process: takes one bot socket per control message until the
+# server goes away
+def host_bots(control: socket.socket, workers: int, budget: float):
+    # people come first when cores are short, the workers inherit this
+    os.nice(NICE)
+    host = BotHost(workers, budget).start()
+    while True:
+        room, fds, _, _ = socket.recv_fds(control, 1024, 1)
+        if not room:
+            return
+        host.add(socket.socket(fileno=fds[0]), room.decode("utf-8"))
+
+
+# the server's handle on its bot process
+@dataclass(slots=True)
+class BotProcess:
+    workers: int = 1
+    budget: float = BUDGET
+    # one message per bot, the room name with the socket attached
+    control: socket.socket = None
+    process: Any = None
+
+    def start(self) -> BotProcess:
+        self.control, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.process = get_context("spawn").Process(
+            target=host_bots, args=(theirs, self.workers, self.budget)
+        )
+        self.process.start()
+        theirs.close()
+        return self
+
+    # the bot process has its own copy of conn, ours is closed
+    def add(self, conn: socket.socket, room: str):
+        with conn:
+            socket.send_fds(self.control, [room.encode("utf-8")], [conn.fileno()])
+
+
+# load test: n bots each open a room and ask the server for a bot opponent,
+# while a probe session measures the ping of a client that plays nobody
+def load(ip: str, port: int, games: int, workers: int, budget: float) -> dict:
+    probe_loop = Loop()
+    probe = probe_loop.open(Session(ip, port))
+    rtts = []
+
+    @probe.handle
+    def pong(session: Session, data: str):
+        rtts.append(session.received - float(data))
+
+    def measure(seconds: float) -> list[float]:
+        rtts.clear()
+        until = monotonic() + seconds
+        while monotonic() < until:
+            probe.send(f"ping:{monotonic()}")
+            probe_loop.run(monotonic() + 0.05)
+        return sorted(rtts)
+
+    def summary(values: list[float]) -> str:
+        if not values:
+            return "-"
+        p95 = values[int(len(values) * 0.95)]
+        return f"p50 {median(values) * 1000:.2f}ms p95 {p95 * 1000:.2f}ms"
+
+    idle = measure(1.0)
+    host = BotHost(workers, budget).start()
+    for i in range(games):
+        host.add(socket.create_connection((ip, port)), f"bots{i}", challenge=True)
+    start = monotonic()
+    busy = []
+    while host.admitted < games or host.bots:
+        busy += measure(0.5)
+    elapsed = monotonic() - start
+    return {
+        "games": dict(host.results),
+        "seconds": round(elapsed, 1),
+        "moves evaluated": host.evaluated,
+        "moves over budget": host.fallbacks,
+        "ping idle": summary(idle),
+        "ping during games": summary(sorted(busy)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="play bots against a server")
+    parser.add_argument("-n", "--games", type=int, default=100)
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("--budget", type=float, default=BUDGET * 1000, help="ms")
+    parser.add_argument("--ip", default="localhost")
+    parser.add_argument("--port", type=int, default=8888)
+    args = parser.parse_args()
+
+    result = load(args.ip, args.port, args.games, args.workers, args.budget / 1000)
+    for key, value in result.items():
+        print(f"{key:<20}{value}")
@@ -3,12 +3,18 @@ from __future__ import annotations
 import socket
 from dataclasses import dataclass, field
 from functools import partial
+from queue import Empty, SimpleQueue
 from threading import Thread
-from time import sleep
+from time import monotonic, perf_counter, sleep
 from typing import TYPE_CHECKING, Any
 
+from protocol import encode, frame_meta, split_frames
+
 if TYPE_CHECKING:
     from game import Game
+    from profiler import Profiler
+    from replay import Recorder
+    from tracing import Tracer
 
 
 def make_decorator(game: Game, client: Client):
@@ -24,20 +30,52 @@ def make_decorator(game: Game, client: Client):
 class Client:
     ip: str = "localhost"
     port: int = 8888
-    con = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # every client owns its connection, opened by connect
+    con: socket.socket = None
     uid: str = None
     name: str = None
     room: str = None
     is_game: bool = False
-    # msgs: deque[tuple[str, str]] = field(default_factory=deque)
+    # game clients queue (msg, receive time) here, the game thread drains them
+    inbox: SimpleQueue = field(default_factory=SimpleQueue)
     handlers: dict[str, Any] = field(default_factory=dict)
-
-    def dispatch(self, msgs):
+    profiler: Profiler = None
+    tracer: Tracer = None
+    recorder: Recorder = None
+    # receive time and metadata of the message being handled
+    received: float = 0.0
+    meta: dict[str, str] = field(default_factory=dict)
+
+    def dispatch(self, msgs, received: float = None):
+        profiler = self.profiler
         for msg in msgs:
+            self.received = received or monotonic()
+            self.meta = frame_meta(msg)
+            if self.recorder:
+                self.recorder.record("in", ":".join(msg))
             if msg[0] in self.handlers:
-                self.handlers[msg[0]](msg[1])
+                if profiler and profiler.enabled:
+                    start = perf_counter()
+                    self.handlers[msg[0]](msg[1])
+                    profiler.message(perf_counter() - start)
+                else:
+                    self.handlers[msg[0]](msg[1])
             else:
                 self.cprint(f"error with msg: {msg}")
+            if self.tracer and self.meta:
+                self.tracer.receive(self.meta, self.received)
+
+    # dispatches queued messages in arrival order until the budget runs out
+    def drain(self, budget: float):
+        deadline = perf_counter() + budget
+        while True:
+            try:
+                msg, received = self.inbox.get_nowait()
+            except Empty:
+                return
+            self.dispatch([msg], received)
+            if perf_counter() >= deadline:
+                return
 
     @property
     def tag(self):
@@ -50,27 +88,37 @@ class Client:
             print(f"\r{' '*40}\r{text}\n{self.tag} {self.room or ''} msg: ", end="")
 
     def connect(self) -> Client:
-        self.con.connect((self.ip, self.port))
+        self.con = socket.create_connection((self.ip, self.port))
         Thread(target=self.listen, daemon=True).start()
         return self
 
+    # runs on its own thread, game clients only parse and queue here so that
+    # handlers never touch the board while pyxel is drawing it
     def listen(self):
         cprint = self.cprint
+        buffer = b""
         while True:
-            data: str = self.con.recv(1024).decode("utf-8")
-            if data:
-                msgs = [
-                    tuple(sub.strip().split(":")) for sub in data.strip().split("|")
-                ][:-1]
-                self.dispatch(msgs)
-                cprint(f"[recieved] {data}")
+            data = self.con.recv(1024)
+            if not data:
+                break
+            received = monotonic()
+            msgs, buffer = split_frames(buffer + data)
+            if self.is_game:
+                for msg in msgs:
+                    self.inbox.put((msg, received))
             else:
-                continue
+                self.dispatch(msgs, received)
+                cprint(f"[recieved] {data.decode('utf-8', 'replace')}")
 
-    def send(self, msg):
+    # traced messages carry latency trace stamps when a tracer is attached
+    def send(self, msg, traced: bool = False, meta: dict = None):
         if msg:
-            msg += "|"
-            self.con.send(msg.encode("utf-8"))
+            if traced and self.tracer:
+                meta = {**(meta or {}), **self.tracer.stamp(self.uid)}
+            data = encode(msg, meta)
+            if self.recorder:
+                self.recorder.record("out", data[:-1].decode("utf-8"))
+            self.con.send(data)
 
     def chat(self):
         while True:
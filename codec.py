@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from piece import PIECES, Piece
+
+if TYPE_CHECKING:
+    from board import Board
+
+# canonical position encoding, always seen from the side that owns the board
+#
+# binary: 36 bytes, one per cell in Board.positions order (x major). 0 is an
+# empty cell, otherwise the low six bits are the piece index + 1 (PIECES
+# order), bit 6 is set when the piece is flipped and bit 7 when it is own.
+#
+# text: six ranks top (y = 0) to bottom separated by "/", each rank left to
+# right. a piece is its letter, upper case when own, followed by "+" when
+# flipped. runs of empty cells are a digit, like fen:
+#
+#   2d3/6/6/6/6/1FD+F2
+
+SIZE = 36
+FLIPPED = 0x40
+OWN = 0x80
+
+NAMES = list(PIECES)
+
+
+def pick_letters(names: list[str]) -> dict[str, str]:
+    letters = {}
+    for name in names:
+        letters[name] = next(
+            c for c in name + "abcdefghijklmnopqrstuvwxyz" if c not in letters.values()
+        )
+    return letters
+
+
+LETTERS = pick_letters(NAMES)
+
+# (name, is_own, is_flipped) <-> code, None for empty cells
+CELLS: list[tuple[str, bool, bool] | None] = [None] * 256
+CODES: dict[tuple[str, bool, bool], int] = {}
+TOKENS = [""] * 256
+TOKEN_CODES: dict[str, int] = {}
+for index, name in enumerate(NAMES):
+    for is_own in (True, False):
+        for is_flipped in (False, True):
+            code = (index + 1) | (FLIPPED if is_flipped else 0) | (OWN if is_own else 0)
+            letter = LETTERS[name]
+            token = (letter.upper() if is_own else letter) + ("+" if is_flipped else "")
+            CELLS[code] = (name, is_own, is_flipped)
+            CODES[name, is_own, is_flipped] = code
+            TOKENS[code] = token
+            TOKEN_CODES[token] = code
+TOKENS[0] = "1"
+
+# byte tables for bytes.translate
+OWN_ONLY = bytes(code if code & OWN else 0 for code in range(256))
+SWAP_OWNER = bytes(code ^ OWN if code else 0 for code in range(256))
+EMPTY_RUN = re.compile("1{2,}")
+TOKEN = re.compile(r"[A-Za-z]\+?|[1-6]")
+# one digit per empty run, so every position has exactly one spelling
+RANK = re.compile(r"(?:[A-Za-z]\+?|[1-6](?![1-6]))+")
+
+
+class CodecError(ValueError):
+    pass
+
+
+def pack(board: Board) -> bytes:
+    codes = CODES
+    return bytes(
+        codes[piece.name, piece.is_own, piece.is_flipped] if piece else 0
+        for row in board.positions
+        for piece in row
+    )
+
+
+def unpack(data: bytes) -> list[tuple[str, bool, bool] | None]:
+    if len(data) != SIZE:
+        raise CodecError(f"expected {SIZE} bytes, got {len(data)}")
+    cells = [CELLS[code] for code in data]
+    if cells.count(None) != data.count(0):
+        raise CodecError(f"unknown piece code in {data.hex()}")
+    return cells
+
+
+def own_only(data: bytes) -> bytes:
+    return data.translate(OWN_ONLY)
+
+
+# the same position seen by the other player
+def rotate(data: bytes) -> bytes:
+    return data[::-1].translate(SWAP_OWNER)
+
+
+# a rank is every sixth byte, board games repeat few ranks so they are memoized
+@lru_cache(4096)
+def rank_text(rank: bytes) -> str:
+    text = "".join(TOKENS[code] for code in rank)
+    return EMPTY_RUN.sub(lambda m: str(len(m.group())), text)
+
+
+@lru_cache(4096)
+def rank_codes(rank: str) -> bytes:
+    if not RANK.fullmatch(rank):
+        raise CodecError(f"bad rank {rank!r}")
+    codes = bytearray()
+    for token in TOKEN.findall(rank):
+        if token.isdigit():
+            codes += bytes(int(token))
+        elif token in TOKEN_CODES:
+            codes.append(TOKEN_CODES[token])
+        else:
+            raise CodecError(f"unknown piece {token!r} in rank {rank!r}")
+    if len(codes) != 6:
+        raise CodecError(f"rank {rank!r} is not 6 cells wide")
+    return bytes(codes)
+
+
+def to_text(data: bytes) -> str:
+    return "/".join([rank_text(data[y::6]) for y in range(6)])
+
+
+def from_text(text: str) -> bytes:
+    ranks = text.split("/")
+    if len(ranks) != 6:
+        raise CodecError(f"expected 6 ranks in {text!r}")
+    cells = bytearray(SIZE)
+    for y, rank in enumerate(ranks):
+        cells[y::6] = rank_codes(rank)
+    return bytes(cells)
+
+
+def encode(board: Board) -> str:
+    return to_text(pack(board))
+
+
+def decode(text: str) -> list[tuple[str, bool, bool] | None]:
+    return unpack(from_text(text))
+
+
+# fresh pieces keyed by position, for setting up or restoring a board
+def pieces(data: bytes) -> dict[tuple[int, int], Piece]:
+    return {
+        divmod(i, 6): Piece(cell[0], is_own=cell[1], is_flipped=cell[2])
+        for i, cell in enumerate(unpack(data))
+        if cell
+    }
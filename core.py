@@ -1,19 +1,17 @@
 from board import Board
+from codec import from_text, own_only, pieces
 from moves import SPAWN_POSITIONS
-from piece import Piece, PIECES
+from piece import Piece
+from tables import SHIELDS, TABLES
 
 
+# the own pieces of a Board.piece_positions message, as opponent pieces in
+# the sender's coordinates
 def decode_opponent_piece_positions(msg):
-    pieces = {}
-    raw_pieces = msg.split("-")
-    for raw_piece in raw_pieces:
-        name, raw_posflip = raw_piece.split()
-        x, y, flip = raw_posflip.split(",")
-        pos = (int(x), int(y))
-        flipped = bool(flip)
-        pieces[pos] = Piece(name, is_own=False, is_flipped=flipped)
-
-    return pieces
+    decoded = pieces(own_only(from_text(msg)))
+    for piece in decoded.values():
+        piece.is_own = False
+    return decoded
 
 
 def calculate_spawn_positions(piece: Piece, board: Board):
@@ -32,34 +30,88 @@ def calculate_spawn_positions(piece: Piece, board: Board):
     return array
 
 
+def shielded(target: Piece, x, y, px, py) -> bool:
+    shields = SHIELDS.get((target.name, target.is_flipped, target.is_own))
+    return shields is not None and (px, py) in shields[x][y]
+
+
+# squares an enemy piece on x,y can be taken on from px,py
+def can_take(target: Piece, x, y, px, py) -> bool:
+    return not target.is_own and not shielded(target, x, y, px, py)
+
+
 def calculate_moves(px, py, piece: Piece, board: Board):
+    table = TABLES[piece.name, piece.is_flipped][px][py]
+    positions = board.positions
     array = []
 
-    for move in piece.moves:
-        dx = move.dx
-        dy = move.dy
-        if move.is_slide:
-            x = px + dx
-            y = py + dy
-            while 0 <= x < 6 and 0 <= y < 6:
-                pos_piece = board.get_piece(x, y)
-                if not pos_piece:
-                    array.append((x, y))
-                    x += dx
-                    y += dy
-                elif not pos_piece.is_own:
-                    array.append((x, y))
-                    break
-                else:
-                    break
+    for (x, y), path in table.steps:
+        for a, b in path:
+            if positions[a][b]:
+                break
         else:
-            x = px + dx
-            y = py + dy
-            if 0 <= x < 6 and 0 <= y < 6:
-                pos_piece = board.get_piece(x, y)
-                if not pos_piece:
-                    array.append((x, y))
-                elif not pos_piece.is_own:
-                    array.append((x, y))
+            target = positions[x][y]
+            if not target or can_take(target, x, y, px, py):
+                array.append((x, y))
+
+    for ray, is_jump in table.slides:
+        for x, y in ray:
+            target = positions[x][y]
+            if not target:
+                array.append((x, y))
+                continue
+            if can_take(target, x, y, px, py):
+                array.append((x, y))
+            if not is_jump:
+                break
 
     return array
+
+
+# every action of the own piece on px,py:
+#   ("move", px, py, x, y)              move, taking what is on x,y
+#   ("strike", px, py, x, y)            take the enemy on x,y and stay
+#   ("command", px, py, ax, ay, x, y)   move the own piece on ax,ay to x,y
+# the acting piece flips after each of them, a commanded piece does not
+def calculate_actions(px, py, piece: Piece, board: Board):
+    array = [("move", px, py, x, y) for x, y in calculate_moves(px, py, piece, board)]
+    table = TABLES[piece.name, piece.is_flipped][px][py]
+    if not (table.strikes or table.commands):
+        return array
+
+    positions = board.positions
+    for x, y in table.strikes:
+        target = positions[x][y]
+        if target and can_take(target, x, y, px, py):
+            array.append(("strike", px, py, x, y))
+
+    for ax, ay in table.commands:
+        commanded = positions[ax][ay]
+        if not commanded or not commanded.is_own:
+            continue
+        for x, y in table.commands:
+            target = positions[x][y]
+            if not target or can_take(target, x, y, ax, ay):
+                array.append(("command", px, py, ax, ay, x, y))
+
+    return array
+
+
+# cached variants live on the board and are dropped by Board.touch, so they
+# only recompute after the board actually changed
+def cached_spawn_positions(piece: Piece, board: Board) -> frozenset[tuple[int, int]]:
+    key = ("spawn", piece.tag == "DUKE")
+    positions = board.cache.get(key)
+    if positions is None:
+        positions = frozenset(calculate_spawn_positions(piece, board))
+        board.cache[key] = positions
+    return positions
+
+
+def cached_moves(px, py, board: Board) -> frozenset[tuple[int, int]]:
+    key = (px, py)
+    positions = board.cache.get(key)
+    if positions is None:
+        positions = frozenset(calculate_moves(px, py, board.get_piece(px, py), board))
+        board.cache[key] = positions
+    return positions
@@ -1,15 +1,20 @@
 from dataclasses import dataclass, field
+from pathlib import Path
+from time import monotonic, perf_counter
 from typing import Any
 
-import pyxel
-
 from board import Board
 from client import Client
 from piece import Piece
 from player import Player
+from profiler import Profiler
+from render import prepare, pyxel
 from states import MenuState, PlayerTurnState, SetupState
 
 TILE = 32
+# seconds per frame the game thread spends on queued network messages
+DRAIN_BUDGET = 0.004
+RESOURCES = Path(__file__).with_name("my_resource.pyxres")
 
 
 @dataclass(slots=True)
@@ -38,10 +43,24 @@ class Game:
     # opponent
     opponent_setup: dict[tuple[int, int], Piece] = field(default_factory=dict)
 
+    # turns are numbered by the server. own moves are applied right away and
+    # sent with the next number, a reject or an out of order relay restores
+    # the board and bag as they were after the last confirmed turn
+    seq: int = 0
+    pending: int = None
+    confirmed: tuple[tuple, list[str]] = None
+
+    # rendering, draw only repaints after something marked the frame dirty
+    dirty: bool = True
+    drawn_version: int = -1
+    mouse: tuple[int, int] = None
+    profiler: Profiler = field(default_factory=Profiler)
+
     def start(self):
         # pyxel stuff
         pyxel.init(240, 240)
-        pyxel.load("my_resource.pyxres")
+        pyxel.load(str(RESOURCES))
+        prepare()
         pyxel.mouse(True)
 
         self.state = MenuState(self)
@@ -57,22 +76,36 @@ class Game:
         self.in_hand: Piece = None
         self.active: Piece = None
         self.opponent_setup = {}
+        self.seq = 0
+        self.pending = None
+        self.confirmed = None
 
         self.is_waiting = False
         self.notifications = []
         self.status = None
+        self.mark_dirty()
         self.client.send("exit_room:")
 
     def attach(self, client: Client):
         self.client = client
+        self.client.profiler = self.profiler
         self.client.connect()
         self.client.send("get_rooms:")
 
+    def mark_dirty(self):
+        self.dirty = True
+
+    def notify(self, text: str):
+        self.notifications.insert(0, text)
+        self.mark_dirty()
+
     def wait(self):
         self.is_waiting = True
+        self.mark_dirty()
 
     def resume(self):
         self.is_waiting = False
+        self.mark_dirty()
 
     def board_setup(self):
         self.resume()
@@ -81,14 +114,84 @@ class Game:
     def finish_setup(self):
         self.player.give_pieces(["seer", "priest"])
         self.state = PlayerTurnState(self)
+        self.confirm()
+        self.mark_dirty()
+
+    # sends an already applied move or spawn and hands the turn over
+    def play(self, msg: str):
+        self.pending = self.seq + 1
+        self.client.send(msg, traced=True, meta={"seq": self.pending})
+        self.wait()
+
+    def confirm(self, seq: int = None):
+        if seq is not None:
+            self.seq = seq
+        self.pending = None
+        self.confirmed = (
+            self.board.snapshot(),
+            [piece.name for piece in self.player.bag],
+        )
+
+    def rollback(self, reason: str):
+        board, bag = self.confirmed
+        self.board.restore(board)
+        self.player.bag = [Piece(name) for name in bag]
+        self.pending = None
+        self.in_hand = None
+        self.active = None
+        self.notify(reason)
 
     def update(self):
-        self.state.update()
+        self.client.drain(DRAIN_BUDGET)
+
+        profiler = self.profiler
+        if pyxel.btnp(pyxel.KEY_F3):
+            profiler.toggle()
+            self.mark_dirty()
+
+        if profiler.enabled:
+            state = self.state
+            start = perf_counter()
+            state.update()
+            profiler.record(
+                profiler.update_times, type(state).__name__, perf_counter() - start
+            )
+        else:
+            self.state.update()
+
+        tracer = self.client.tracer
+        if (profiler.enabled and profiler.should_ping()) or (
+            tracer and tracer.should_ping()
+        ):
+            self.client.send(f"ping:{monotonic()}")
+
+        # pyxel paints the visible cursor into the screen image, a frame that
+        # is not redrawn after the mouse moved keeps the old cursor
+        mouse = (pyxel.mouse_x, pyxel.mouse_y)
+        if mouse != self.mouse:
+            self.mouse = mouse
+            self.mark_dirty()
 
     def draw(self):
+        if self.board.version != self.drawn_version or self.profiler.enabled:
+            self.dirty = True
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.drawn_version = self.board.version
+
         pyxel.cls(pyxel.COLOR_WHITE)
 
-        self.state.draw()
+        profiler = self.profiler
+        if profiler.enabled:
+            state = self.state
+            start = perf_counter()
+            state.draw()
+            profiler.record(
+                profiler.draw_times, type(state).__name__, perf_counter() - start
+            )
+        else:
+            self.state.draw()
 
         if self.is_waiting:
             pyxel.text(200, 0, "WAITING...", pyxel.COLOR_RED)
@@ -96,6 +199,16 @@ class Game:
         if self.notifications:
             pyxel.text(0, 234, self.notifications[0], pyxel.COLOR_LIGHT_BLUE)
 
+        if profiler.enabled:
+            self.draw_profiler()
+
+    def draw_profiler(self):
+        lines = self.profiler.lines()
+        top = 240 - len(lines) * 6 - 2
+        pyxel.rect(0, top, 240, 240 - top, pyxel.COLOR_BLACK)
+        for i, line in enumerate(lines):
+            pyxel.text(1, top + 1 + i * 6, line, pyxel.COLOR_LIME)
+
 
 if __name__ == "__main__":
     game = Game()
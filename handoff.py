@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import json
+import socket
+import struct
+
+# zero downtime restarts. a running server listens on a unix socket, a new
+# process started with --takeover connects to it and receives
+#
+#   state_length:u64 fd_count:u32 state(json)
+#   fd_count descriptors as SCM_RIGHTS, at most MAX_FDS per one byte message
+#
+# the listening socket comes first, then one per client in the order of
+# state["clients"]. the new process answers with one byte once it serves
+# them and the old one exits, clients only see a pause in between.
+
+HEADER = struct.Struct("<QI")
+MAX_FDS = 250
+READY = b"k"
+
+
+def send_state(sock: socket.socket, state: dict, fds: list[int]):
+    data = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data), len(fds)) + data)
+    for i in range(0, len(fds), MAX_FDS):
+        socket.send_fds(sock, [b"f"], fds[i : i + MAX_FDS])
+
+
+def receive_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("handoff closed early")
+        data += chunk
+    return bytes(data)
+
+
+def receive_state(sock: socket.socket) -> tuple[dict, list[int]]:
+    length, count = HEADER.unpack(receive_exactly(sock, HEADER.size))
+    state = json.loads(receive_exactly(sock, length))
+    fds = []
+    while len(fds) < count:
+        # one byte at a time so no read crosses into the next batch
+        data, received, _, _ = socket.recv_fds(sock, 1, MAX_FDS)
+        if not data:
+            raise ConnectionError("handoff closed early")
+        fds += received
+    return state, fds
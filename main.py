@@ -1,17 +1,31 @@
+import argparse
+
 from client import Client, make_decorator
 from core import decode_opponent_piece_positions
 from game import Game
+from replay import Recorder
+from tracing import Tracer
+
+# handlers are collected here and bound to a game and client by register, so
+# replay.py can drive the same handlers without a connection
+HANDLERS = []
+
+
+def handle(func):
+    HANDLERS.append(func)
+    return func
 
-game = Game()
-client = Client(is_game=True)
-game.attach(client)
 
-handle = make_decorator(game, client)
+def register(game: Game, client: Client):
+    bind = make_decorator(game, client)
+    for func in HANDLERS:
+        bind(func)
 
 
 @handle
 def rooms(game: Game, client: Client, data: str):
     game.rooms = data.split(",")
+    game.mark_dirty()
 
 
 @handle
@@ -21,7 +35,7 @@ def uid(game: Game, client: Client, uid: str):
 
 @handle
 def name(game: Game, client: Client, name: str):
-    game.name = name
+    client.name = name
 
 
 @handle
@@ -31,7 +45,7 @@ def room(game: Game, client: Client, room: str):
 
 @handle
 def info(game: Game, client: Client, data: str):
-    game.notifications.insert(0, data)
+    game.notify(data)
 
 
 @handle
@@ -45,10 +59,24 @@ def positions(game: Game, client: Client, data: str):
     game.opponent_setup = pieces
 
 
+# relayed opponent turns carry the server turn number, anything but the next
+# one means this client missed or invented a turn. the server accepted the
+# relayed turn, so it is played on top of the last confirmed board
+def catch_up(game: Game, client: Client) -> int:
+    seq = client.meta.get("seq")
+    if seq is None:
+        return game.seq + 1
+    if game.pending is not None or int(seq) != game.seq + 1:
+        game.rollback("desync, board restored")
+    return int(seq)
+
+
 @handle
 def move(game: Game, client: Client, opponent_move: str):
     if opponent_move:
+        seq = catch_up(game, client)
         game.board.move_opponent(opponent_move)
+        game.confirm(seq)
 
     game.resume()
 
@@ -56,21 +84,71 @@ def move(game: Game, client: Client, opponent_move: str):
 @handle
 def spawn_opponent(game: Game, client: Client, opponent_move: str):
     if opponent_move:
+        seq = catch_up(game, client)
         game.board.spawn_opponent(opponent_move)
+        game.confirm(seq)
     game.resume()
 
 
+@handle
+def ack(game: Game, client: Client, seq: str):
+    if game.pending == int(seq):
+        game.confirm(int(seq))
+
+
+@handle
+def reject(game: Game, client: Client, seq: str):
+    if seq and game.pending == int(seq):
+        game.rollback("move rejected")
+        game.resume()
+
+
 @handle
 def won(game: Game, client: Client, opponent_move: str):
     game.wins += 1
     game.status = "won"
+    game.mark_dirty()
+    if client.tracer:
+        client.tracer.flush(room=game.room, uid=client.uid, result="won")
+    if client.recorder:
+        client.recorder.save(game)
 
 
 @handle
 def lost(game: Game, client: Client, opponent_move: str):
     game.loses += 1
     game.status = "lost"
+    game.mark_dirty()
+    if client.tracer:
+        client.tracer.flush(room=game.room, uid=client.uid, result="lost")
+    if client.recorder:
+        client.recorder.save(game)
+
+
+@handle
+def pong(game: Game, client: Client, sent: str):
+    game.profiler.rtt.push(client.received - float(sent))
+    if client.tracer and "st" in client.meta:
+        client.tracer.clock.sample(
+            float(sent), float(client.meta["st"]), client.received
+        )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="duke client")
+    parser.add_argument("--trace", default=None, help="append move latency per match")
+    parser.add_argument("--record", default=None, help="save every match to this dir")
+    parser.add_argument("--name", default=None, help="name to be rated under")
+    args = parser.parse_args()
+
+    game = Game()
+    client = Client(is_game=True)
+    register(game, client)
+    if args.trace:
+        client.tracer = Tracer(args.trace)
+    if args.record:
+        client.recorder = Recorder(args.record)
+    game.attach(client)
+    if args.name:
+        client.send(f"name:{args.name}")
     game.start()
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from board import Board
+from core import calculate_actions, calculate_spawn_positions
+from piece import PERFT_PIECES, Piece, load_pieces
+from tables import register_pieces
+
+# perft walks every action of the side to move (piece moves, strikes and
+# commands plus spawning each distinct piece left in the bag, see
+# core.calculate_actions), then hands the board to the other
+# player with Board.swap_sides, the same way the opponent sees it over the
+# network. the recorded counts are the known-good leaf counts per depth.
+
+
+@dataclass(slots=True)
+class Position:
+    # (name, x, y, is_own, is_flipped) seen from the side to move
+    pieces: list[tuple[str, int, int, bool, bool]]
+    bags: tuple[list[str], list[str]] = field(default_factory=lambda: ([], []))
+    counts: list[int] = field(default_factory=list)
+
+
+POSITIONS = {
+    "setup": Position(
+        pieces=[
+            ("duke", 2, 5, True, False),
+            ("foot", 2, 4, True, False),
+            ("foot", 1, 5, True, False),
+            ("duke", 3, 0, False, False),
+            ("foot", 3, 1, False, False),
+            ("foot", 4, 0, False, False),
+        ],
+        bags=(["seer", "priest"], ["seer", "priest"]),
+        counts=[7, 49, 523, 5499, 72178],
+    ),
+    "midgame": Position(
+        pieces=[
+            ("duke", 3, 5, True, True),
+            ("foot", 3, 3, True, True),
+            ("seer", 1, 4, True, False),
+            ("priest", 4, 2, True, False),
+            ("duke", 2, 1, False, False),
+            ("foot", 2, 2, False, False),
+            ("seer", 4, 1, False, True),
+            ("priest", 0, 0, False, True),
+        ],
+        bags=([], ["foot"]),
+        counts=[19, 243, 4287, 58270, 975306],
+    ),
+    "open": Position(
+        pieces=[
+            ("duke", 0, 5, True, False),
+            ("priest", 2, 3, True, False),
+            ("duke", 5, 0, False, True),
+            ("priest", 3, 2, False, False),
+        ],
+        counts=[11, 124, 1178, 11142, 97990],
+    ),
+    # perft_pieces.txt pieces, flipped where they strike, command or shield
+    "tactics": Position(
+        pieces=[
+            ("duke", 2, 5, True, False),
+            ("champion", 1, 3, True, True),
+            ("general", 3, 4, True, True),
+            ("bowman", 4, 3, True, True),
+            ("warden", 0, 4, True, False),
+            ("marshal", 5, 5, True, False),
+            ("duke", 3, 0, False, False),
+            ("champion", 2, 2, False, False),
+            ("general", 1, 1, False, True),
+            ("bowman", 4, 1, False, True),
+            ("warden", 2, 3, False, True),
+            ("marshal", 0, 0, False, True),
+        ],
+        bags=(["foot"], []),
+        counts=[25, 639, 14589, 329948],
+    ),
+}
+
+
+@dataclass(slots=True)
+class Perft:
+    board: Board
+    # bag of the side to move first
+    bags: list[list[str]]
+
+    def actions(self):
+        board = self.board
+        duke_pos = board.duke_position
+        if not duke_pos:
+            return []
+
+        array = []
+        for x, row in enumerate(board.positions):
+            for y, piece in enumerate(row):
+                if piece and piece.is_own:
+                    array += calculate_actions(x, y, piece, board)
+
+        bag = self.bags[0]
+        if bag:
+            squares = calculate_spawn_positions(Piece(bag[0]), board)
+            for name in sorted(set(bag)):
+                for x, y in squares:
+                    array.append(("spawn", name, x, y))
+
+        return array
+
+    def make(self, action):
+        board = self.board
+        x, y = action[-2:]
+        captured = board.get_piece(x, y)
+        match action:
+            case ("move", px, py, _, _):
+                board.move_piece(px, py, x, y)
+            case ("strike", px, py, _, _):
+                board.place_piece(x, y, None)
+                board.flip_piece(px, py)
+            case ("command", px, py, ax, ay, _, _):
+                board.shift_piece(ax, ay, x, y)
+                board.flip_piece(px, py)
+            case ("spawn", name, _, _):
+                self.bags[0].remove(name)
+                board.place_piece(x, y, Piece(name))
+        board.swap_sides()
+        self.bags.reverse()
+        return captured
+
+    def unmake(self, action, captured):
+        board = self.board
+        self.bags.reverse()
+        board.swap_sides()
+        x, y = action[-2:]
+        match action:
+            case ("move", px, py, _, _):
+                board.move_piece(x, y, px, py)
+            case ("strike", px, py, _, _):
+                board.flip_piece(px, py)
+            case ("command", px, py, ax, ay, _, _):
+                board.flip_piece(px, py)
+                board.shift_piece(x, y, ax, ay)
+            case ("spawn", name, _, _):
+                self.bags[0].append(name)
+        board.place_piece(x, y, captured)
+
+    def count(self, depth: int) -> int:
+        if depth == 0:
+            return 1
+        actions = self.actions()
+        if depth == 1:
+            return len(actions)
+
+        nodes = 0
+        for action in actions:
+            captured = self.make(action)
+            nodes += self.count(depth - 1)
+            self.unmake(action, captured)
+        return nodes
+
+    def divide(self, depth: int) -> dict[str, int]:
+        result = {}
+        for action in self.actions():
+            captured = self.make(action)
+            result[format_action(action)] = self.count(depth - 1)
+            self.unmake(action, captured)
+        return result
+
+
+def format_action(action) -> str:
+    match action:
+        case ("spawn", name, x, y):
+            return f"{name}->{x},{y}"
+        case ("command", px, py, ax, ay, x, y):
+            return f"{px},{py}:{ax},{ay}->{x},{y}"
+        case (kind, px, py, x, y):
+            return f"{px},{py}{'x' if kind == 'strike' else '->'}{x},{y}"
+
+
+# the positions use fixture pieces the game does not know. they go into the
+# shared move tables the first time a position is loaded, not on import
+@lru_cache(1)
+def register_fixtures():
+    register_pieces(load_pieces(PERFT_PIECES))
+
+
+def load(position: Position) -> Perft:
+    register_fixtures()
+    board = Board()
+    for name, x, y, is_own, is_flipped in position.pieces:
+        board.place_piece(x, y, Piece(name, is_own=is_own, is_flipped=is_flipped))
+    return Perft(board, [list(position.bags[0]), list(position.bags[1])])
+
+
+def verify(names=None, max_depth=None) -> list[str]:
+    errors = []
+    for name in names or POSITIONS:
+        position = POSITIONS[name]
+        for depth, expected in enumerate(position.counts, start=1):
+            if max_depth and depth > max_depth:
+                break
+            nodes = load(position).count(depth)
+            if nodes != expected:
+                errors.append(f"{name} depth {depth}: got {nodes}, expected {expected}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="move generation perft")
+    parser.add_argument("positions", nargs="*")
+    parser.add_argument("-d", "--depth", type=int, default=None)
+    parser.add_argument("--divide", action="store_true")
+    args = parser.parse_args()
+
+    if args.divide:
+        for name in args.positions or POSITIONS:
+            perft = load(POSITIONS[name])
+            for action, nodes in perft.divide(args.depth or 1).items():
+                print(f"{name} {action}: {nodes}")
+        sys.exit()
+
+    errors = verify(args.positions, args.depth)
+    for error in errors:
+        print(error)
+    print("perft ok" if not errors else f"perft failed ({len(errors)})")
+    sys.exit(1 if errors else 0)
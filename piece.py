@@ -1,8 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-
-import pyxel
+from pathlib import Path
 
 from moves import Move, create_move
 
@@ -23,8 +22,12 @@ def load_pieces(filename):
     return pieces
 
 
-TILE = 32
-PIECES = load_pieces("game_pieces.txt")
+PIECES = load_pieces(Path(__file__).with_name("game_pieces.txt"))
+# pieces the game never hands out, perft registers them to exercise jumps,
+# strikes, commands and shields (tables.register_pieces). they stay out of
+# PIECES, so the codec and the file formats only know the game pieces
+EXTRA_PIECES = {}
+PERFT_PIECES = Path(__file__).with_name("perft_pieces.txt")
 
 
 @dataclass(slots=True)
@@ -44,9 +47,10 @@ class Piece:
         return self.flipped_moves if self.is_flipped else self.normal_moves
 
     def __post_init__(self):
-        for move in PIECES[self.name][0]:
+        normal, flipped = PIECES.get(self.name) or EXTRA_PIECES[self.name]
+        for move in normal:
             self.normal_moves.append(create_move(move))
-        for move in PIECES[self.name][1]:
+        for move in flipped:
             self.flipped_moves.append(create_move(move))
 
     def flip(self) -> Piece:
@@ -54,54 +58,11 @@ class Piece:
         return self
 
     def draw(self, x, y):
-        t = TILE
-        white = pyxel.COLOR_WHITE
-        if self.is_own:
-            pyxel.blt(x * t + 1, y * t + 1, 0, 0, 0, t - 1, t - 1)
-        else:
-            pyxel.blt(x * t + 1, y * t + 1, 0, 0, 32, t - 1, t - 1)
-        for move in self.moves:
-            dx = move.dx
-            dy = move.dy
-            if not self.is_own:
-                dx = -dx
-                dy = -dy
-            if move.is_slide and move.is_jump:
-                pyxel.rect(
-                    x * t + 1 + 15 + dx * 5, y * t + 1 + 15 + dy * 5, 2, 2, white
-                )
-                pyxel.rectb(x * t + 1 + 14 + dx * 5, y * t + 1 + 14 + dy * 5, 4, 4, 0)
-            elif move.is_jump:
-                pyxel.rectb(x * t + 1 + 14 + dx * 5, y * t + 1 + 14 + dy * 5, 4, 4, 0)
-            elif move.is_slide:
-                pyxel.rect(
-                    x * t + 1 + 15 + dx * 5, y * t + 1 + 15 + dy * 5, 2, 2, white
-                )
-            else:
-                pyxel.rect(x * t + 1 + 15 + dx * 5, y * t + 1 + 15 + dy * 5, 2, 2, 0)
-            pyxel.rectb(
-                x * t + 1 + 15 + dx * 5 - 1, y * t + 1 + 15 + dy * 5 - 1, 4, 4, 0
-            )
+        from render import draw_piece
+
+        draw_piece(self, x, y)
 
     def drag(self, x, y):
-        white = pyxel.COLOR_WHITE
-        if self.is_own:
-            pyxel.blt(x, y, 0, 0, 0, TILE - 1, TILE - 1)
-        else:
-            pyxel.blt(x, y, 0, 0, 32, TILE - 1, TILE - 1)
-        for move in self.moves:
-            dx = move.dx
-            dy = move.dy
-            if not self.is_own:
-                dx = -dx
-                dy = -dy
-            if move.is_slide and move.is_jump:
-                pyxel.rect(x + 15 + dx * 5, y + 15 + dy * 5, 2, 2, white)
-                pyxel.rectb(x + 14 + dx * 5, y + 14 + dy * 5, 4, 4, 0)
-            elif move.is_jump:
-                pyxel.rectb(x + 14 + dx * 5, y + 14 + dy * 5, 4, 4, white)
-            elif move.is_slide:
-                pyxel.rect(x + 15 + dx * 5, y + 15 + dy * 5, 2, 2, white)
-            else:
-                pyxel.rect(x + 15 + dx * 5, y + 15 + dy * 5, 2, 2, 0)
-            pyxel.rectb(x + 15 + dx * 5 - 1, y + 15 + dy * 5 - 1, 4, 4, 0)
+        from render import drag_piece
+
+        drag_piece(self, x, y)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from pathlib import Path
+from random import Random
+
+from board import Board
+
+# a policy picks one action out of the legal ones for the side to move, the
+# board is always seen from that side. actions are tuples:
+#   ("move", px, py, x, y)   move the own piece on px,py to x,y
+#   ("strike", px, py, x, y) take the enemy on x,y without moving
+#   ("command", px, py, ax, ay, x, y)
+#                            move the own piece on ax,ay to x,y
+#   ("draw",)                pull a random piece out of the bag
+#   ("place", name, x, y)    place the piece in hand (setup or after a draw)
+#
+# bags is how many pieces are left in the own and the opponent bag, None when
+# the caller does not know
+
+POLICIES = {}
+TABLEBASE = Path(__file__).with_name("endgame.tb")
+BOOK = Path(__file__).with_name("opening.book")
+
+
+def policy(func):
+    POLICIES[func.__name__] = func
+    return func
+
+
+def captures(board: Board, actions):
+    array = []
+    for action in actions:
+        if action[0] in ("move", "strike", "command"):
+            target = board.get_piece(*action[-2:])
+            if target:
+                array.append((target, action))
+    return array
+
+
+@policy
+def random(board: Board, actions, rng: Random, bags: tuple[int, int] = None):
+    return rng.choice(actions)
+
+
+# takes the duke when it can, any other capture next, otherwise plays random
+@policy
+def greedy(board: Board, actions, rng: Random, bags: tuple[int, int] = None):
+    taken = captures(board, actions)
+    for target, action in taken:
+        if target.tag == "DUKE":
+            return action
+    if taken:
+        return rng.choice(taken)[1]
+    return rng.choice(actions)
+
+
+@lru_cache(1)
+def open_tablebase():
+    if not TABLEBASE.exists():
+        return None
+    from tablebase import Tablebase
+
+    return Tablebase(TABLEBASE)
+
+
+# the fastest win, a draw, or the slowest loss
+def endgame_score(result):
+    kind, dtc = result
+    if kind == "loss":
+        return (2, -dtc)
+    if kind == "draw":
+        return (1, 0)
+    return (0, dtc)
+
+
+# plays perfectly once the position is in endgame.tb (python tablebase.py),
+# greedy before that. the table is solved without spawns, so it is only used
+# once both bags are empty
+@policy
+def endgame(board: Board, actions, rng: Random, bags: tuple[int, int] = None):
+    tablebase = open_tablebase()
+    if tablebase and bags == (0, 0) and actions[0][0] != "place":
+        scored = []
+        for action in actions:
+            result = tablebase.probe_action(board, action)
+            if result is None:
+                break
+            scored.append((endgame_score(result), action))
+        else:
+            best = max(score for score, _ in scored)
+            return rng.choice([action for score, action in scored if score == best])
+    return greedy(board, actions, rng)
+
+
+@lru_cache(1)
+def open_book():
+    if not BOOK.exists():
+        return None
+    from book import Book
+
+    return Book(BOOK)
+
+
+# plays the best scoring book move while the position is in opening.book
+# (python book.py), endgame after that
+@policy
+def book(board: Board, actions, rng: Random, bags: tuple[int, int] = None):
+    opening = open_book()
+    if opening:
+        in_hand = actions[0][1] if actions[0][0] == "place" else None
+        scored = [
+            # one win and one loss of prior so single lucky games don't dominate
+            ((wins + draws / 2 + 1) / (games + 2), action)
+            for action, games, wins, draws in opening.probe(board, in_hand)
+            if action in actions
+        ]
+        if scored:
+            best = max(score for score, _ in scored)
+            return rng.choice([action for score, action in scored if score == best])
+    return endgame(board, actions, rng, bags)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from time import perf_counter
+
+# frame and network timings for the F3 overlay. everything is kept in fixed
+# size ring buffers and nothing is recorded while the overlay is hidden.
+
+SAMPLES = 120
+
+
+class RingBuffer:
+    __slots__ = ("values", "index", "count")
+
+    def __init__(self, size: int = SAMPLES):
+        self.values = array("d", bytes(8 * size))
+        self.index = 0
+        self.count = 0
+
+    def push(self, value: float):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        if self.count < len(self.values):
+            self.count += 1
+
+    def samples(self):
+        if self.count < len(self.values):
+            return self.values[: self.count]
+        return self.values
+
+    def mean(self) -> float:
+        return sum(self.samples()) / self.count if self.count else 0.0
+
+    def max(self) -> float:
+        return max(self.samples()) if self.count else 0.0
+
+    # number of samples (timestamps) newer than since
+    def newer(self, since: float) -> int:
+        return sum(1 for value in self.samples() if value > since)
+
+
+@dataclass(slots=True)
+class Profiler:
+    enabled: bool = False
+    # state class name -> seconds per call
+    update_times: dict[str, RingBuffer] = field(default_factory=dict)
+    draw_times: dict[str, RingBuffer] = field(default_factory=dict)
+    dispatch_times: RingBuffer = field(default_factory=RingBuffer)
+    # arrival times of inbound messages, sized for a busy second
+    arrivals: RingBuffer = field(default_factory=lambda: RingBuffer(1024))
+    rtt: RingBuffer = field(default_factory=lambda: RingBuffer(16))
+    last_ping: float = 0.0
+
+    def toggle(self):
+        self.enabled = not self.enabled
+
+    def record(self, table: dict[str, RingBuffer], name: str, elapsed: float):
+        if name not in table:
+            table[name] = RingBuffer()
+        table[name].push(elapsed)
+
+    def message(self, elapsed: float):
+        self.dispatch_times.push(elapsed)
+        self.arrivals.push(perf_counter())
+
+    def messages_per_second(self) -> int:
+        return self.arrivals.newer(perf_counter() - 1.0)
+
+    # true once a second while enabled, the caller then sends a ping
+    def should_ping(self) -> bool:
+        now = perf_counter()
+        if now - self.last_ping >= 1.0:
+            self.last_ping = now
+            return True
+        return False
+
+    def lines(self) -> list[str]:
+        array = []
+        for name, times in self.update_times.items():
+            draws = self.draw_times.get(name) or RingBuffer(1)
+            array.append(
+                f"{name[:-5]:<10} upd {times.mean() * 1000:5.2f}/{times.max() * 1000:5.2f}"
+                f" drw {draws.mean() * 1000:5.2f}/{draws.max() * 1000:5.2f}ms"
+            )
+        array.append(
+            f"net {self.dispatch_times.mean() * 1000:5.2f}/"
+            f"{self.dispatch_times.max() * 1000:5.2f}ms"
+            f" {self.messages_per_second()} msg/s"
+            f" rtt {self.rtt.mean() * 1000:.1f}ms"
+        )
+        return array
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+# wire format shared by client and server: "name:data|name:data|..."
+# recv can cut a frame anywhere, so readers keep the unfinished tail as
+# bytes and feed it back in front of the next chunk. a frame may carry an
+# optional third field of "key=value;key=value" metadata, handlers only
+# ever see the data field.
+
+SEPARATOR = b"|"
+
+
+def split_frames(buffer: bytes) -> tuple[list[tuple[str, ...]], bytes]:
+    *frames, rest = buffer.split(SEPARATOR)
+    msgs = []
+    for frame in frames:
+        text = frame.decode("utf-8").strip()
+        if text:
+            msgs.append(tuple(text.split(":")))
+    return msgs, rest
+
+
+def format_meta(meta: dict) -> str:
+    return ";".join(f"{key}={value}" for key, value in meta.items())
+
+
+def parse_meta(raw: str) -> dict[str, str]:
+    meta = {}
+    for pair in raw.split(";"):
+        key, _, value = pair.partition("=")
+        if key:
+            meta[key] = value
+    return meta
+
+
+def frame_meta(msg: tuple[str, ...]) -> dict[str, str]:
+    return parse_meta(msg[2]) if len(msg) > 2 else {}
+
+
+def encode(msg: str, meta: dict = None) -> bytes:
+    if meta:
+        msg = f"{msg}:{format_meta(meta)}"
+    return (msg + "|").encode("utf-8")
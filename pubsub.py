@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import socket
+from dataclasses import dataclass, field
+from queue import Empty, SimpleQueue
+from typing import Callable
+
+from protocol import encode
+
+# chat and announcements. publishing encodes the message once and queues it
+# from any thread, then wakes the thread that owns the sockets, which hands
+# the same bytes to every subscriber of the channel. a publisher pays one
+# queue put however many are listening, and every byte a socket gets still
+# goes through one writer, so a chat frame never lands inside another frame:
+#
+#   global        every connection
+#   lobby         connections that are not in a room
+#   room:<name>   the members of a room
+#
+# subscribers are sockets. one that can not take a message right away misses
+# it, chat is not worth stalling everyone else for.
+
+GLOBAL = "global"
+LOBBY = "lobby"
+
+
+def room_channel(name: str) -> str:
+    return f"room:{name}"
+
+
+@dataclass(slots=True)
+class Broker:
+    channels: dict[str, set[socket.socket]] = field(default_factory=dict)
+    queue: SimpleQueue = field(default_factory=SimpleQueue)
+    # the owner selects on wakeup and calls deliver once it is readable
+    wakeup: socket.socket = None
+    waker: socket.socket = None
+    sent: int = 0
+    dropped: int = 0
+
+    def start(self) -> Broker:
+        self.wakeup, self.waker = socket.socketpair()
+        self.wakeup.setblocking(False)
+        self.waker.setblocking(False)
+        return self
+
+    def subscribe(self, channel: str, conn: socket.socket):
+        self.channels.setdefault(channel, set()).add(conn)
+
+    def unsubscribe(self, channel: str, conn: socket.socket):
+        if subscribers := self.channels.get(channel):
+            subscribers.discard(conn)
+            if not subscribers:
+                del self.channels[channel]
+
+    def publish(self, channel: str, msg: str, exclude: socket.socket = None):
+        self.queue.put((channel, encode(msg), exclude))
+        try:
+            self.waker.send(b"\0")
+        except BlockingIOError:
+            # a wakeup is pending already
+            pass
+
+    # runs on the owner thread, write(conn, data) queues data on the socket
+    # without blocking and tells whether it was taken
+    def deliver(self, write: Callable[[socket.socket, bytes], bool]):
+        try:
+            while self.wakeup.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                channel, data, exclude = self.queue.get_nowait()
+            except Empty:
+                return
+            for conn in tuple(self.channels.get(channel, ())):
+                if conn is exclude:
+                    continue
+                if write(conn, data):
+                    self.sent += 1
+                else:
+                    self.dropped += 1
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass, field
+from queue import Empty, Queue
+from threading import Thread
+from time import monotonic, time
+
+# player ratings kept by the server. ratings live in memory, every finished
+# game is queued for a writer thread that commits to sqlite in batches, so
+# the relay never waits on the disk.
+#
+# the leaderboard is a fenwick tree counting players per whole rating point,
+# best first, so the rank of a player and the k-th best rating are prefix
+# sums over the tree.
+
+K = 32
+START = 1500.0
+HIGHEST = 4000
+BATCH = 256
+# longest a finished game waits before its batch is committed
+LINGER = 0.5
+
+SCHEMA = """
+create table if not exists players (
+    name text primary key,
+    rating real not null,
+    wins integer not null,
+    losses integer not null
+);
+create table if not exists games (
+    winner text not null,
+    loser text not null,
+    finished real not null
+);
+"""
+UPSERT = """
+insert into players (name, rating, wins, losses) values (?, ?, ?, ?)
+on conflict (name) do update set
+    rating = excluded.rating, wins = excluded.wins, losses = excluded.losses
+"""
+
+
+def expected(elo: float, other: float) -> float:
+    return 1 / (1 + 10 ** ((other - elo) / 400))
+
+
+@dataclass(slots=True)
+class Fenwick:
+    size: int
+    tree: list[int] = None
+
+    def __post_init__(self):
+        self.tree = [0] * (self.size + 1)
+
+    def add(self, i: int, delta: int):
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    # sum of slots 0..i - 1
+    def prefix(self, i: int) -> int:
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    # the slot holding the k-th item, k from 1
+    def find(self, k: int) -> int:
+        i = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            if i + step <= self.size and self.tree[i + step] < k:
+                i += step
+                k -= self.tree[i]
+            step >>= 1
+        return i
+
+
+@dataclass(slots=True)
+class Player:
+    name: str
+    rating: float = START
+    wins: int = 0
+    losses: int = 0
+
+    # leaderboard slot, the best ratings come first
+    @property
+    def slot(self) -> int:
+        return HIGHEST - min(max(round(self.rating), 0), HIGHEST)
+
+    @property
+    def row(self):
+        return self.name, self.rating, self.wins, self.losses
+
+
+@dataclass(slots=True)
+class Ratings:
+    path: str
+    players: dict[str, Player] = field(default_factory=dict)
+    tree: Fenwick = field(default_factory=lambda: Fenwick(HIGHEST + 1))
+    # names per slot
+    slots: dict[int, set[str]] = field(default_factory=dict)
+    queue: Queue = field(default_factory=Queue)
+    writer: Thread = None
+
+    def __post_init__(self):
+        with sqlite3.connect(self.path) as db:
+            db.executescript(SCHEMA)
+            for row in db.execute("select name, rating, wins, losses from players"):
+                self.insert(Player(*row))
+        db.close()
+        self.writer = Thread(target=self.write_behind, daemon=True)
+        self.writer.start()
+
+    def insert(self, player: Player):
+        self.players[player.name] = player
+        self.slots.setdefault(player.slot, set()).add(player.name)
+        self.tree.add(player.slot, 1)
+
+    def remove(self, player: Player):
+        names = self.slots[player.slot]
+        names.discard(player.name)
+        if not names:
+            del self.slots[player.slot]
+        self.tree.add(player.slot, -1)
+
+    def player(self, name: str) -> Player:
+        if name not in self.players:
+            self.insert(Player(name))
+        return self.players[name]
+
+    def record(self, winner: str, loser: str):
+        first = self.player(winner)
+        second = self.player(loser)
+        delta = K * (1 - expected(first.rating, second.rating))
+        for player, change in ((first, delta), (second, -delta)):
+            self.remove(player)
+            player.rating += change
+            self.insert(player)
+        first.wins += 1
+        second.losses += 1
+        self.queue.put((first.row, second.row, (winner, loser, time())))
+
+    # 1 for the best player, ties share a rank
+    def rank(self, name: str) -> int | None:
+        player = self.players.get(name)
+        if player is None:
+            return None
+        return self.tree.prefix(player.slot) + 1
+
+    def top(self, n: int) -> list[Player]:
+        array = []
+        k = 1
+        while len(array) < n and k <= len(self.players):
+            names = self.slots[self.tree.find(k)]
+            ordered = sorted(
+                (self.players[name] for name in names),
+                key=lambda p: (-p.rating, p.name),
+            )
+            array += ordered[: n - len(array)]
+            k += len(names)
+        return array
+
+    def write_behind(self):
+        db = sqlite3.connect(self.path)
+        while True:
+            batch = [self.queue.get()]
+            deadline = monotonic() + LINGER
+            try:
+                while len(batch) < BATCH and batch[-1] is not None:
+                    batch.append(self.queue.get(timeout=max(deadline - monotonic(), 0)))
+            except Empty:
+                pass
+            done = batch[-1] is None
+            games = [entry for entry in batch if entry]
+            db.executemany(UPSERT, [row for entry in games for row in entry[:2]])
+            db.executemany(
+                "insert into games (winner, loser, finished) values (?, ?, ?)",
+                [entry[2] for entry in games],
+            )
+            db.commit()
+            if done:
+                db.close()
+                return
+
+    # commits whatever is queued
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import sys
+from importlib.util import LazyLoader, find_spec, module_from_spec
+from types import ModuleType
+from typing import TYPE_CHECKING
+
+from board import TILE, Board
+from piece import PIECES, Piece
+
+if TYPE_CHECKING:
+    from pyxel import Image
+
+# pyxel drawing for the model classes. board.py and piece.py import this
+# lazily from their draw methods, so only the client pulls in pyxel. the
+# client modules take pyxel from here, it is only loaded once something
+# draws or reads input, so a headless replay never loads it.
+#
+# the grid and every piece look (type x flipped x owner, plus the dragged
+# variant) are baked once into spare image banks by prepare, so a frame costs
+# one blit for the board and one blit per piece.
+
+
+def lazy_import(name: str) -> ModuleType:
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = find_spec(name)
+    spec.loader = LazyLoader(spec.loader)
+    module = module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+pyxel = lazy_import("pyxel")
+
+GRID_BANK = 1
+ATLAS_BANK = 2
+# bank 0 holds the base tiles from my_resource.pyxres
+OWN_TILE = (0, 0)
+OPPONENT_TILE = (0, 32)
+
+# (name, is_flipped, is_own, is_dragged) -> (u, v) in the atlas bank
+SPRITES: dict[tuple[str, bool, bool, bool], tuple[int, int]] = {}
+
+
+def bake_grid(image: Image, board: Board):
+    t = TILE
+    ln = board.line_length
+    nr = board.rows
+    nc = board.cols
+    dblue = pyxel.COLOR_DARK_BLUE
+    image.rect(0, 0, ln + 1, ln + 1, pyxel.COLOR_WHITE)
+    for r in range(board.rows):
+        for c in range(board.cols):
+            # row
+            image.line(r * t, c * t, r * t, ln, dblue)
+            # col
+            image.line(r * t, c * t, ln, c * t, dblue)
+    image.line(nr * t, 0, ln, nc * t, dblue)
+    image.line(0, nc * t, nr * t, ln, dblue)
+
+
+def bake_piece(image: Image, u, v, piece: Piece, is_dragged: bool, tiles: Image):
+    white = pyxel.COLOR_WHITE
+    tile_u, tile_v = OWN_TILE if piece.is_own else OPPONENT_TILE
+    image.blt(u, v, tiles, tile_u, tile_v, TILE - 1, TILE - 1)
+    for move in piece.moves:
+        dx = move.dx
+        dy = move.dy
+        if not piece.is_own:
+            dx = -dx
+            dy = -dy
+        x = u + 15 + dx * 5
+        y = v + 15 + dy * 5
+        if move.is_slide and move.is_jump:
+            image.rect(x, y, 2, 2, white)
+            image.rectb(x - 1, y - 1, 4, 4, 0)
+        elif move.is_jump:
+            # the dragged piece always showed jumps with a white frame
+            image.rectb(x - 1, y - 1, 4, 4, white if is_dragged else 0)
+        elif move.is_slide:
+            image.rect(x, y, 2, 2, white)
+        else:
+            image.rect(x, y, 2, 2, 0)
+        image.rectb(x - 1, y - 1, 4, 4, 0)
+
+
+# needs pyxel.init and the resource file loaded, Game.start calls it
+def prepare():
+    bake_grid(pyxel.images[GRID_BANK], Board())
+
+    tiles = pyxel.images[0]
+    atlas = pyxel.images[ATLAS_BANK]
+    per_row = atlas.width // TILE
+    SPRITES.clear()
+    for name in sorted(PIECES):
+        for is_flipped in (False, True):
+            for is_own in (True, False):
+                piece = Piece(name, is_own=is_own, is_flipped=is_flipped)
+                for is_dragged in (False, True):
+                    i = len(SPRITES)
+                    u = i % per_row * TILE
+                    v = i // per_row * TILE
+                    bake_piece(atlas, u, v, piece, is_dragged, tiles)
+                    SPRITES[name, is_flipped, is_own, is_dragged] = (u, v)
+
+
+def blt_piece(sx, sy, piece: Piece, is_dragged: bool):
+    if not SPRITES:
+        prepare()
+    u, v = SPRITES[piece.name, piece.is_flipped, piece.is_own, is_dragged]
+    pyxel.blt(sx, sy, ATLAS_BANK, u, v, TILE - 1, TILE - 1)
+
+
+def draw_pieces(board: Board):
+    for x, row in enumerate(board.positions):
+        for y, piece in enumerate(row):
+            if piece:
+                blt_piece(x * TILE + 1, y * TILE + 1, piece, False)
+
+
+def draw_board(board: Board):
+    if not SPRITES:
+        prepare()
+    size = board.line_length + 1
+    pyxel.blt(0, 0, GRID_BANK, 0, 0, size, size)
+
+    draw_pieces(board)
+
+
+def draw_piece(piece: Piece, x, y):
+    blt_piece(x * TILE + 1, y * TILE + 1, piece, False)
+
+
+def drag_piece(piece: Piece, x, y):
+    blt_piece(x, y, piece, True)
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass, field
+from math import inf
+from pathlib import Path
+from time import monotonic, perf_counter, strftime
+from typing import TYPE_CHECKING
+
+from client import Client
+from codec import to_text
+from piece import Piece
+from protocol import frame_meta
+
+if TYPE_CHECKING:
+    from game import Game
+
+# match recordings. the recorder sits in Client.dispatch and Client.send and
+# keeps every frame with its time, one file per match:
+#
+#   {"t": 1.25, "d": "in", "m": "move:1,1->2,2:seq=3"}
+#   ...
+#   {"end": {"room": ..., "status": ..., "wins": .., "loses": .., "board": "6/..."}}
+#
+# playback feeds inbound frames through the handlers in main.py and applies
+# outbound frames the way the states did when they were sent, so own moves
+# replay without any input. both happen on the game thread in the original
+# client, so the recorded order is the order they were handled in.
+
+
+@dataclass(slots=True)
+class Recorder:
+    directory: str
+    start: float = field(default_factory=monotonic)
+    events: list[dict] = field(default_factory=list)
+    saved: int = 0
+
+    def record(self, direction: str, frame: str):
+        self.events.append(
+            {"t": round(monotonic() - self.start, 6), "d": direction, "m": frame}
+        )
+
+    def save(self, game: Game) -> Path:
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.saved += 1
+        name = f"{strftime('%Y%m%d-%H%M%S')}-{game.room}-{game.client.uid}-{self.saved}"
+        path = directory / f"{name}.jsonl"
+        with open(path, "w") as f:
+            for event in self.events:
+                f.write(json.dumps(event) + "\n")
+            f.write(json.dumps({"end": final_state(game)}) + "\n")
+        self.events.clear()
+        self.start = monotonic()
+        return path
+
+
+def final_state(game: Game) -> dict:
+    return {
+        "room": game.room,
+        "status": game.status,
+        "wins": game.wins,
+        "loses": game.loses,
+        "board": to_text(game.board.snapshot()),
+    }
+
+
+def load(path) -> tuple[list[dict], dict]:
+    events = []
+    end = None
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if "end" in record:
+                end = record["end"]
+            else:
+                events.append(record)
+    return events, end
+
+
+# stands in for the connection, nothing leaves the process
+class ReplayClient(Client):
+    def connect(self):
+        pass
+
+    def send(self, msg, traced: bool = False, meta: dict = None):
+        pass
+
+
+# outbound frame name -> what the sending state did locally
+OUTBOUND = {}
+
+
+def outbound(func):
+    OUTBOUND[func.__name__] = func
+    return func
+
+
+def coordinates(raw: str) -> list[int]:
+    return [int(v) for v in raw.split(",")]
+
+
+@outbound
+def room(game: Game, data: str, meta: dict):
+    game.room = data
+    game.wait()
+
+
+@outbound
+def positions(game: Game, data: str, meta: dict):
+    from core import decode_opponent_piece_positions
+
+    # the same decoder as the opponent, minus the mirroring
+    for (x, y), piece in decode_opponent_piece_positions(data).items():
+        piece.is_own = True
+        game.board.place_piece(x, y, piece)
+    game.player.initial_pieces = []
+    game.state.is_finished = True
+    game.wait()
+
+
+@outbound
+def ready(game: Game, data: str, meta: dict):
+    game.board.update_opponent(game.opponent_setup)
+    game.finish_setup()
+
+
+@outbound
+def move(game: Game, data: str, meta: dict):
+    raw_pre, raw_after = data.split("->")
+    game.board.move_piece(*coordinates(raw_pre), *coordinates(raw_after))
+    if "seq" in meta:
+        game.pending = int(meta["seq"])
+    game.wait()
+
+
+@outbound
+def spawn_opponent(game: Game, data: str, meta: dict):
+    name, raw_pos = data.split("->")
+    bag = game.player.bag
+    bag.pop(next(i for i, piece in enumerate(bag) if piece.name == name))
+    game.board.place_piece(*coordinates(raw_pos), Piece(name))
+    if "seq" in meta:
+        game.pending = int(meta["seq"])
+    game.wait()
+
+
+@outbound
+def lost(game: Game, data: str, meta: dict):
+    game.loses += 1
+    game.state.gameover = True
+    game.wait()
+
+
+@outbound
+def exit_room(game: Game, data: str, meta: dict):
+    game.reset()
+
+
+@dataclass(slots=True)
+class Playback:
+    game: Game
+    events: list[dict]
+    index: int = 0
+
+    @property
+    def is_done(self):
+        return self.index >= len(self.events)
+
+    # applies every event recorded up to the given match time
+    def step(self, until: float = inf):
+        game = self.game
+        events = self.events
+        while self.index < len(events) and events[self.index]["t"] <= until:
+            event = events[self.index]
+            self.index += 1
+            msg = tuple(event["m"].split(":"))
+            if event["d"] == "in":
+                game.client.dispatch([msg])
+            elif msg[0] in OUTBOUND:
+                OUTBOUND[msg[0]](game, msg[1], frame_meta(msg))
+
+
+def new_game() -> Game:
+    from game import Game
+    from main import register
+    from states import MenuState
+
+    game = Game()
+    client = ReplayClient()
+    register(game, client)
+    game.client = client
+    client.profiler = game.profiler
+    game.state = MenuState(game)
+    return game
+
+
+def replay(path) -> tuple[Game, dict]:
+    events, end = load(path)
+    game = new_game()
+    Playback(game, events).step()
+    return game, end
+
+
+# replays recordings as fast as possible and compares the final state
+def check(paths) -> list[Path]:
+    failed = []
+    for path in paths:
+        game, end = replay(path)
+        if end is not None and final_state(game) != end:
+            failed.append(path)
+    return failed
+
+
+def watch(path, speed: float):
+    import pyxel
+
+    from game import RESOURCES
+    from render import prepare
+
+    events, _ = load(path)
+    game = new_game()
+    playback = Playback(game, events)
+
+    pyxel.init(240, 240, title=f"replay {Path(path).name}")
+    pyxel.load(str(RESOURCES))
+    prepare()
+    start = monotonic()
+
+    def update():
+        if not playback.is_done:
+            playback.step((monotonic() - start) * speed)
+
+    pyxel.run(update, game.draw)
+
+
+def recordings(paths: list[str]) -> list[Path]:
+    files = []
+    for name in paths:
+        path = Path(name)
+        files.extend(sorted(path.glob("*.jsonl")) if path.is_dir() else [path])
+    return files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replay recorded matches")
+    parser.add_argument("paths", nargs="+", help="recordings or dirs of them")
+    parser.add_argument(
+        "--speed", type=float, default=None, help="render at this speed"
+    )
+    args = parser.parse_args()
+
+    files = recordings(args.paths)
+    if args.speed:
+        watch(files[0], args.speed)
+        sys.exit()
+
+    start = perf_counter()
+    failed = check(files)
+    elapsed = perf_counter() - start
+    for path in failed:
+        print(f"mismatch {path}")
+    print(f"{len(files) - len(failed)}/{len(files)} ok in {elapsed:.2f}s")
+    sys.exit(1 if failed else 0)
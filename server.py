@@ -1,11 +1,32 @@
 from __future__ import annotations
 
+import argparse
+import os
+import selectors
 import socket
+import sys
 from dataclasses import dataclass, field
-from functools import lru_cache, partial
+from functools import partial
+from itertools import count
+from pathlib import Path
 from threading import Thread
-from typing import Any
-from uuid import uuid4
+from time import monotonic
+from typing import Any, Iterator
+
+from codec import CodecError, from_text
+from handoff import READY, receive_state, send_state
+from ratings import Ratings
+from protocol import encode, frame_meta, split_frames
+from pubsub import GLOBAL, LOBBY, Broker, room_channel
+from tracing import LatencyStats, write_summary
+
+# a peer whose unsent output grows past this stopped reading, it is cut off
+# instead of buffering without end
+MAX_OUTBOX = 256 * 1024
+# next to the source like the game resources, not wherever the server starts
+RATINGS = Path(__file__).with_name("ratings.db")
+# what server bots are called, no player can take it
+BOT_NAME = "bot"
 
 
 def remove_from_list(inlist: list[Any], x: Any) -> list[Any]:
@@ -24,11 +45,30 @@ def sprint(text: str) -> None:
 class Server:
     ip: str = "localhost"
     port: int = 8888
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    clients: list[ServerClient] = field(default_factory=list)
+    sock: socket.socket = None
+    # one thread serves every connection, idle ones only cost a registration
+    selector: selectors.BaseSelector = field(default_factory=selectors.DefaultSelector)
+    clients: dict[int, ServerClient] = field(default_factory=dict)
+    # connections are numbered instead of carrying a random hex string
+    uids: Iterator[int] = field(default_factory=lambda: count(1))
     rooms: list[Room] = field(default_factory=list)
     names: list[str] = field(default_factory=list)
     handlers: dict[str, Any] = field(default_factory=dict)
+    # chat and announcements, see pubsub.py
+    broker: Broker = field(default_factory=Broker)
+    # appends the per room latency breakdown of every finished match
+    trace_path: str = None
+    tablebase: Any = None
+    # sqlite file the player ratings are kept in
+    ratings_path: str = None
+    ratings: Ratings = None
+    # unix socket a restarted server takes the connections over from
+    handoff_path: str = None
+    handoff: socket.socket = None
+    # the bot process, see bots.py. with bot_after set, a room that waited that
+    # many seconds for a second player gets a bot
+    bots: Any = None
+    bot_after: float = None
 
     def __hash__(self):
         return hash((self.ip, self.port))
@@ -47,36 +87,193 @@ class Server:
 
     # creates the socket and start the listener in a thread
     def start(self) -> Server:
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.bind((self.ip, self.port))
-        self.sock.listen(2)
+        self.sock.listen(socket.SOMAXCONN)
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.open_handoff()
         print("listening...")
-        Thread(target=self.listener, daemon=True).start()
+        self.serve()
         return self
 
-    # awaits new connections
-    def listener(self):
-        while True:
-            conn, addr = self.sock.accept()
-            client = self.new_client(conn, addr)
-            Thread(target=self.handle_client, args=[client]).start()
+    def serve(self):
+        self.broker.start()
+        self.selector.register(self.broker.wakeup, selectors.EVENT_READ)
+        if self.ratings_path:
+            self.ratings = Ratings(self.ratings_path)
+        Thread(target=self.listener, daemon=True).start()
 
-    # awaits client msgs message_size=1024 chars
-    def handle_client(self, client):
+    # awaits new connections, client msgs and takeovers
+    def listener(self):
+        # wakes up now and then to look for rooms to fill
+        timeout = 1.0 if self.bots and self.bot_after else None
         while True:
-            data: str = client.conn.recv(1024).decode("utf-8")
-            if data:
-                msgs = [
-                    tuple(sub.strip().split(":")) for sub in data.strip().split("|")
-                ][:-1]
-                self.dispatch(msgs, client)
-                sprint(f"[recieved] {data}")
-            else:
-                break
+            for key, events in self.selector.select(timeout):
+                client = key.data
+                if key.fileobj is self.sock:
+                    self.accept()
+                elif key.fileobj is self.handoff:
+                    self.hand_over()
+                elif key.fileobj is self.broker.wakeup:
+                    self.broker.deliver(self.write_chat)
+                # dropped by an earlier event of the same select, a bot whose
+                # room emptied
+                elif client.uid not in self.clients:
+                    continue
+                else:
+                    if events & selectors.EVENT_WRITE:
+                        client.flush()
+                    if events & selectors.EVENT_READ:
+                        self.handle_client(client)
+            if timeout:
+                self.fill_rooms()
+
+    def accept(self):
+        conn, addr = self.sock.accept()
+        self.new_client(conn, addr)
+
+    # reads what a ready client sent, message_size=1024 chars
+    def handle_client(self, client: ServerClient):
+        try:
+            data = client.conn.recv(1024)
+        except OSError:
+            data = b""
+        if data:
+            received = monotonic()
+            msgs, client.buffer = split_frames(client.buffer + data)
+            self.dispatch(msgs, client, received)
+            sprint(f"[recieved] {data.decode('utf-8', 'replace')}")
+            return
+        self.drop_client(client)
 
+    def drop_client(self, client: ServerClient):
+        self.selector.unregister(client.conn)
+        client.conn.close()
         self.remove_client(client)
         sprint(f"{client.tag} disconnected")
 
+    # handoff section
+    def open_handoff(self):
+        if not self.handoff_path:
+            return
+        if os.path.exists(self.handoff_path):
+            os.unlink(self.handoff_path)
+        self.handoff = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.handoff.bind(self.handoff_path)
+        self.handoff.listen(1)
+        self.selector.register(self.handoff, selectors.EVENT_READ)
+
+    # runs on the listener, so nothing is read or sent while the state goes
+    # out. exits once the new process serves the clients
+    def hand_over(self):
+        conn, _ = self.handoff.accept()
+        # bots do not come along, whoever plays one goes back to the lobby
+        # instead of waiting for a turn that never comes
+        for room in [r for r in self.rooms if any(c.is_bot for c in r.clients)]:
+            for client in [c for c in room.clients if not c.is_bot]:
+                client.send("info:the server restarted, the bot game is over")
+                self.client_exit_room(client)
+        clients = [c for c in self.clients.values() if not c.is_bot]
+        fds = [self.sock.fileno(), *(c.conn.fileno() for c in clients)]
+        # the new process reads the ratings back once it has the clients
+        if self.ratings:
+            self.ratings.close()
+        # queued chat goes over with the outboxes
+        self.broker.deliver(self.write_chat)
+        try:
+            send_state(conn, self.state(clients), fds)
+            if conn.recv(1) != READY:
+                raise ConnectionError("the new server did not take over")
+        except OSError as e:
+            conn.close()
+            sprint(f"handoff failed: {e}")
+            if self.ratings:
+                self.ratings = Ratings(self.ratings_path)
+            return
+        sprint(f"handed over {len(clients)} clients and {len(self.rooms)} rooms")
+        os._exit(0)
+
+    def state(self, clients: list[ServerClient]) -> dict:
+        def uid_of(client):
+            return client.uid if client else None
+
+        return {
+            "uid": next(self.uids),
+            "clients": [
+                [
+                    c.uid,
+                    c.name,
+                    c.buffer.decode("latin-1"),
+                    bytes(c.outbox or b"").decode("latin-1"),
+                ]
+                for c in clients
+            ],
+            "rooms": [
+                {
+                    "name": room.name,
+                    "max_clients": room.max_clients,
+                    "clients": [c.uid for c in room.clients],
+                    "host": uid_of(room._host),
+                    "seq": room.seq,
+                    "turn": uid_of(room.turn),
+                    "latency": room.latency.hops,
+                }
+                for room in self.rooms
+            ],
+        }
+
+    def restore(self, state: dict, fds: list[int]):
+        self.sock = socket.socket(fileno=fds[0])
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.uids = count(state["uid"])
+        for (uid, name, buffer, outbox), fd in zip(state["clients"], fds[1:]):
+            client = ServerClient(
+                socket.socket(fileno=fd),
+                uid,
+                name and sys.intern(name),
+                buffer=buffer.encode("latin-1"),
+                selector=self.selector,
+            )
+            client.conn.setblocking(False)
+            self.clients[uid] = client
+            events = selectors.EVENT_READ
+            if outbox:
+                client.outbox = bytearray(outbox.encode("latin-1"))
+                events |= selectors.EVENT_WRITE
+            self.selector.register(client.conn, events, client)
+            self.broker.subscribe(GLOBAL, client.conn)
+            self.broker.subscribe(LOBBY, client.conn)
+        clients = self.clients
+        for entry in state["rooms"]:
+            room = Room(
+                entry["name"],
+                [clients[uid] for uid in entry["clients"]],
+                entry["max_clients"],
+                clients.get(entry["host"]),
+                LatencyStats(entry["latency"]),
+                entry["seq"],
+                clients.get(entry["turn"]),
+            )
+            for client in room.clients:
+                client.room = room
+                self.broker.unsubscribe(LOBBY, client.conn)
+                self.broker.subscribe(room_channel(room.name), client.conn)
+            self.rooms.append(room)
+
+    # takes the listening socket, clients and rooms over from the server on
+    # handoff_path instead of binding
+    def take_over(self) -> Server:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(self.handoff_path)
+            state, fds = receive_state(conn)
+            self.restore(state, fds)
+            conn.sendall(READY)
+        self.open_handoff()
+        print(f"took over {len(self.clients)} clients and {len(self.rooms)} rooms")
+        self.serve()
+        return self
+
     # Commands section
     # command decorator
 
@@ -85,48 +282,101 @@ class Server:
         self.handlers[func.__name__] = part
         return part
 
-    def dispatch(self, msgs, client: ServerClient):
+    def dispatch(self, msgs, client: ServerClient, received: float = None):
         for msg in msgs:
-            if msg[0] in self.handlers:
-                self.handlers[msg[0]](msg[1], client)
-            else:
+            client.meta = frame_meta(msg)
+            if "tid" in client.meta:
+                client.meta["sr"] = f"{received or monotonic():.6f}"
+            if msg[0] not in self.handlers:
                 sprint(f"error with msg: {msg}")
+                continue
+            # one loop serves every client, a bad message or a dead peer
+            # must not stop it
+            try:
+                self.handlers[msg[0]](msg[1], client)
+            except Exception as e:
+                sprint(f"error with msg: {msg}: {e!r}")
+        client.meta = None
 
     # client section
     def new_client(self, conn, addr) -> ServerClient:
-        client = ServerClient(conn, addr)
-        self.clients.append(client)
-        sprint(f"new client connected with add:{client.addr} and uid:{client.uid}")
+        conn.setblocking(False)
+        client = ServerClient(conn, next(self.uids), selector=self.selector)
+        self.clients[client.uid] = client
+        self.selector.register(conn, selectors.EVENT_READ, client)
+        self.broker.subscribe(GLOBAL, conn)
+        self.broker.subscribe(LOBBY, conn)
+        sprint(f"new client connected with add:{addr} and uid:{client.uid}")
         return client
 
     def remove_client(self, client: ServerClient) -> Server:
-        if client.room:
-            remove_from_list(client.room.clients, client)
-        remove_from_list(self.clients, client)
-        for room in self.rooms:
-            if room.is_empty:
-                remove_from_list(self.rooms, client.room)
+        self.client_exit_room(client)
+        self.clients.pop(client.uid, None)
+        self.broker.unsubscribe(GLOBAL, client.conn)
+        self.broker.unsubscribe(LOBBY, client.conn)
 
     def client_exit_room(self, client: ServerClient):
         if room := client.room:
             remove_from_list(room.clients, client)
             if room.is_empty:
                 remove_from_list(self.rooms, room)
+                sprint(f"room {room.name} was deleted")
+            self.broker.unsubscribe(room_channel(room.name), client.conn)
+            self.broker.subscribe(LOBBY, client.conn)
+            # nobody left to play the bots
+            if all(c.is_bot for c in room.clients):
+                for bot in list(room.clients):
+                    self.drop_client(bot)
         client.room = None
 
+    # bot section
+    # the bot joins through join_room like anyone. the server keeps one end
+    # of a socketpair, the bot process gets the other
+    def add_bot(self, room: Room) -> bool:
+        if not self.bots or room.bot_invited:
+            return False
+        room.bot_invited = True
+        ours, theirs = socket.socketpair()
+        client = self.new_client(ours, "bot")
+        client.name = BOT_NAME
+        client.is_bot = True
+        self.bots.add(theirs, room.name)
+        return True
+
+    def fill_rooms(self):
+        now = monotonic()
+        for room in self.rooms:
+            if (
+                room.max_clients == 2
+                and room.num_clients == 1
+                and now - room.opened >= self.bot_after
+            ):
+                self.add_bot(room)
+
     # room section
-    @lru_cache(30)
-    def get_room(self, name: str) -> Room:
+    # rooms are dropped once empty, a cached lookup would hand out dead ones
+    def find_room(self, name: str) -> Room | None:
         for room in self.rooms:
             if room.name == name:
                 return room
 
+    def get_room(self, name: str) -> Room:
+        if room := self.find_room(name):
+            return room
+
         room = Room(name=name, max_clients=2)
         self.rooms.append(room)
         sprint(f"room {room.name} was created")
         return room
 
     def join_room(self, client: ServerClient, room_name: str):
+        # a bot arrives a while after it was invited. it only takes the seat
+        # next to a waiting player, the room may be gone or empty again
+        if client.is_bot:
+            room = self.find_room(room_name)
+            if not (room and room.num_clients == 1 and not room.clients[0].is_bot):
+                self.drop_client(client)
+                return
         room = self.get_room(room_name)
         if room.is_full:
             client.send("info:room is full")
@@ -134,14 +384,13 @@ class Server:
         if client.room == room:
             client.send("info:you are already in this room")
             return
-        elif client.room is not None:
-            client.room.remove_client(client)
-            if client.room.is_empty:
-                remove_from_list(self.rooms, client.room)
-                sprint(f"room {client.room.name} was deleted")
+        # leaving the old room drops a bot left alone in it
+        self.client_exit_room(client)
 
         room.clients.append(client)
         client.room = room
+        self.broker.unsubscribe(LOBBY, client.conn)
+        self.broker.subscribe(room_channel(room_name), client.conn)
         client.send(f"room:{room_name}")
         if room.is_full:
             self.room_send(room, "room_ready:")
@@ -150,20 +399,55 @@ class Server:
     def send_to(self, client: ServerClient, msg):
         client.send(msg)
 
-    def broadcast(self, msg, exclude=None):
-        for c in self.clients:
-            if c is not exclude:
-                c.send(msg)
+    # broker deliveries, chat is dropped for a client with output waiting
+    def write_chat(self, conn: socket.socket, data: bytes) -> bool:
+        try:
+            client = self.selector.get_key(conn).data
+        except KeyError:
+            return False
+        return client.write(data, droppable=True)
+
+    # announcements go through the broker, the caller does not wait for them
+    def broadcast(self, msg, exclude: ServerClient = None):
+        self.broker.publish(GLOBAL, msg, exclude and exclude.conn)
 
     def room_send(self, room: Room, msg: str):
         for c in room.clients:
             c.send(msg)
 
+    # turn order and numbering, a move that is out of turn or skips a number
+    # is rejected so the sender rolls back to its last confirmed board
+    def take_turn(self, client: ServerClient) -> bool:
+        room = client.room
+        seq = client.meta.get("seq")
+        if room.turn is not client or (seq and int(seq) != room.seq + 1):
+            client.send(f"reject:{seq or ''}")
+            return False
+        room.seq += 1
+        room.turn = next((c for c in room.clients if c is not client), client)
+        if seq:
+            client.send(f"ack:{seq}")
+        return True
+
+    def flush_latency(self, room: Room):
+        if self.trace_path and len(room.latency):
+            write_summary(
+                self.trace_path,
+                {
+                    "room": room.name,
+                    "samples": len(room.latency),
+                    "hops": room.latency.summary(),
+                },
+            )
+        room.latency.clear()
+
     def console(self):
         while True:
             msg = input(f"\r{' '*40}\rserver message: ")
             match msg:
                 case "exit":
+                    if self.ratings:
+                        self.ratings.close()
                     exit()
                 case "stats":
                     sprint(self.stats)
@@ -183,37 +467,106 @@ def extract_command(msg: str):
         return (msg.split()[0], " ".join(msg.split()[1::]))
 
 
-@dataclass
+# kept small, a lobby full of idle clients is mostly these. everything that
+# is not needed until a client does something is a shared default
+@dataclass(slots=True)
 class ServerClient:
-    conn: str
-    addr: str
-    uid: str = None
+    conn: socket.socket
+    uid: int
     name: str = None
     room: Room = None
+    # unparsed tail of the last read
+    buffer: bytes = b""
+    # metadata of the message being handled
+    meta: dict[str, str] = None
+    is_bot: bool = False
+    # the socket is non-blocking, what it did not take waits in outbox until
+    # the selector reports it writable
+    selector: selectors.BaseSelector = None
+    outbox: bytearray = None
 
-    def __post_init__(self):
-        self.uid = uuid4().hex[:7]
+    @property
+    def addr(self):
+        return self.conn.getpeername()
 
     @property
     def tag(self):
-        return self.name or self.uid
-
-    def send(self, msg):
-        msg += "|"
-        self.conn.send(msg.encode("utf-8"))
-
-    def room_broadcast(self, msg):
+        return self.name or str(self.uid)
+
+    def send(self, msg, meta=None):
+        self.write(encode(msg, meta))
+
+    # never blocks the loop, returns whether the data was queued
+    def write(self, data: bytes, droppable: bool = False) -> bool:
+        if self.outbox is not None:
+            if droppable:
+                return False
+            if len(self.outbox) + len(data) > MAX_OUTBOX:
+                self.cut_off()
+                return False
+            self.outbox += data
+            return True
+        try:
+            sent = self.conn.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            # gone, the next read drops it
+            return False
+        if sent < len(data):
+            self.outbox = bytearray(data[sent:])
+            self.selector.modify(
+                self.conn, selectors.EVENT_READ | selectors.EVENT_WRITE, self
+            )
+        return True
+
+    def flush(self):
+        try:
+            sent = self.conn.send(self.outbox)
+        except BlockingIOError:
+            return
+        except OSError:
+            sent = len(self.outbox)
+        del self.outbox[:sent]
+        if not self.outbox:
+            self.outbox = None
+            self.selector.modify(self.conn, selectors.EVENT_READ, self)
+
+    # the read side sees the shutdown and drops the client from the loop,
+    # so nobody iterating rooms or clients has them change underneath
+    def cut_off(self):
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # pass meta to keep a latency trace going through the relay
+    def room_broadcast(self, msg, meta=None):
+        if meta and "tid" in meta:
+            relayed = monotonic()
+            meta["ss"] = f"{relayed:.6f}"
+            sr = float(meta["sr"])
+            self.room.latency.add(
+                uplink=sr - float(meta["cs"]) - float(meta["co"]),
+                server=relayed - sr,
+            )
         for c in self.room.clients:
             if c is not self:
-                c.send(msg)
+                c.send(msg, meta)
 
 
-@dataclass
+@dataclass(slots=True)
 class Room:
     name: str = None
     clients: list[ServerClient] = field(default_factory=list)
     max_clients: int = 10
     _host: ServerClient = None
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    # number of the last accepted turn and who plays next
+    seq: int = 0
+    turn: ServerClient = None
+    opened: float = field(default_factory=monotonic)
+    bot_invited: bool = False
 
     @property
     def host(self):
@@ -241,18 +594,57 @@ class Room:
 
 
 if __name__ == "__main__":
-    server = Server()
+    parser = argparse.ArgumentParser(description="duke server")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--trace", default=None, help="append move latency per room")
+    parser.add_argument("--tablebase", default=None, help="answer probe requests")
+    parser.add_argument(
+        "--ratings", default=str(RATINGS), help="sqlite file, empty to turn off"
+    )
+    parser.add_argument("--handoff", default=None, help="unix socket for restarts")
+    parser.add_argument(
+        "--takeover", action="store_true", help="replace the server on --handoff"
+    )
+    parser.add_argument(
+        "--bots", type=int, default=0, help="host bot players on this many workers"
+    )
+    parser.add_argument(
+        "--bot-after", type=float, default=None, help="seconds before a bot joins"
+    )
+    parser.add_argument("--bot-budget", type=float, default=250, help="ms per move")
+    args = parser.parse_args()
+    if args.takeover and not args.handoff:
+        parser.error("--takeover needs the --handoff socket of the running server")
+    server = Server(
+        port=args.port,
+        trace_path=args.trace,
+        ratings_path=args.ratings,
+        handoff_path=args.handoff,
+        bot_after=args.bot_after,
+    )
+    if args.tablebase:
+        from tablebase import Tablebase
+
+        server.tablebase = Tablebase(args.tablebase)
+    if args.bots:
+        from bots import BotProcess
+
+        server.bots = BotProcess(args.bots, args.bot_budget / 1000).start()
 
     # commands
     @server.handle
     def name(server: Server, data: str, client: ServerClient):
-        client.name = data
+        if data == BOT_NAME:
+            client.send(f"info:{BOT_NAME} is reserved for server bots")
+            return
+        client.name = sys.intern(data)
         client.send(f"name:{data}")
 
     @server.handle
     def a(server: Server, data: str, client: ServerClient):
-        # TODO
-        server.broadcast(f"relay:{client.tag}: {data}", client)
+        # chat stays in the room, or the lobby outside of one
+        channel = room_channel(client.room.name) if client.room else LOBBY
+        server.broker.publish(channel, f"relay:{client.tag}: {data}", client.conn)
         sprint(f"{client.tag} sent: {data}")
 
     @server.handle
@@ -267,8 +659,8 @@ if __name__ == "__main__":
     def w(server: Server, data: str, client: ServerClient):
         target = data.split()[0]
         msg = data.replace(target, "").strip()
-        for c in server.clients:
-            if c.uid == target or c.name == target:
+        for c in server.clients.values():
+            if str(c.uid) == target or c.name == target:
                 # TODO
                 c.send(f"info:{client.tag} says: {msg}")
 
@@ -285,30 +677,95 @@ if __name__ == "__main__":
     @server.handle
     def move(server: Server, data: str, client: ServerClient):
         if client.room and client.room.is_full and client.room.max_clients == 2:
-            client.room_broadcast(f"move:{data}")
+            if server.take_turn(client):
+                client.room_broadcast(f"move:{data}", client.meta)
 
     @server.handle
     def spawn_opponent(server: Server, data: str, client: ServerClient):
         if client.room and client.room.is_full and client.room.max_clients == 2:
-            client.room_broadcast(f"spawn_opponent:{data}")
+            if server.take_turn(client):
+                client.room_broadcast(f"spawn_opponent:{data}", client.meta)
 
     @server.handle
     def ready(server: Server, data: str, client: ServerClient):
         if client.room and client.room.is_full and client.room.max_clients == 2:
             if client == client.room.host:
+                client.room.seq = 0
+                client.room.turn = client
                 client.send("move:")
 
     @server.handle
     def lost(server: Server, data: str, client: ServerClient):
-        if client.room and client.room.is_full and client.room.max_clients == 2:
-            for c in client.room.clients:
+        # only a running game ends, ready starts one and this clears it again
+        room = client.room
+        if room and room.is_full and room.max_clients == 2 and room.turn is not None:
+            for c in room.clients:
                 if c != client:
                     c.send("won:")
                 else:
                     c.send("lost:")
+            room.turn = None
+            server.flush_latency(room)
+            # uids start over with every server, only names carry a rating.
+            # bots are not rated, they would all share one
+            winner = next(c for c in room.clients if c is not client)
+            if (
+                server.ratings
+                and winner.name
+                and client.name
+                and not (winner.is_bot or client.is_bot)
+            ):
+                server.ratings.record(winner.name, client.name)
+
+    # leaderboard:N, the best N players as name,rating,wins,losses;...
+    @server.handle
+    def leaderboard(server: Server, data: str, client: ServerClient):
+        count = int(data) if data.isdigit() else 10
+        players = server.ratings.top(count) if server.ratings else []
+        rows = [f"{p.name},{p.rating:.0f},{p.wins},{p.losses}" for p in players]
+        client.send(f"leaderboard:{';'.join(rows)}")
+
+    # rank:name, own rank without a name, answers rank:name,rank,rating,players
+    @server.handle
+    def rank(server: Server, data: str, client: ServerClient):
+        name = data or client.name or ""
+        rank = server.ratings.rank(name) if server.ratings and name else None
+        if rank is None:
+            client.send(f"rank:{name}")
+            return
+        rating = server.ratings.players[name].rating
+        client.send(f"rank:{name},{rank},{rating:.0f},{len(server.ratings.players)}")
+
+    @server.handle
+    def ping(server: Server, data: str, client: ServerClient):
+        client.send(f"pong:{data}", {"st": f"{monotonic():.6f}"})
+
+    # position in codec text seen from the side to move
+    @server.handle
+    def probe(server: Server, data: str, client: ServerClient):
+        result = None
+        if server.tablebase:
+            try:
+                result = server.tablebase.probe_data(from_text(data))
+            except CodecError as e:
+                client.send(f"info:{e}")
+                return
+        client.send(f"probe:{','.join(map(str, result)) if result else ''}")
+
+    # asks for a bot to take the free seat of the own room
+    @server.handle
+    def bot(server: Server, data: str, client: ServerClient):
+        room = client.room
+        if not (room and room.max_clients == 2 and room.num_clients == 1):
+            client.send("info:a bot needs a room with one free seat")
+        elif not server.add_bot(room):
+            client.send("info:no bot available")
 
     @server.handle
     def exit_room(server: Server, data: str, client: ServerClient):
         server.client_exit_room(client)
 
-    server.start().console()
+    if args.takeover:
+        server.take_over().console()
+    else:
+        server.start().console()
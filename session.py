@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import argparse
+import heapq
+import selectors
+import socket
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import count
+from statistics import median
+from time import monotonic, perf_counter
+from typing import Any, Callable
+
+from protocol import encode, frame_meta, split_frames
+
+# many client sessions in one process. every Session owns its socket and
+# handlers, a Loop serves all of them from one selector on the calling
+# thread, so thousands of bots or load test clients need no thread each.
+# handlers are registered per session, with Session.handle or with
+# client.make_decorator(context, session):
+#
+#   loop = Loop()
+#   session = loop.open(Session())
+#
+#   @session.handle
+#   def pong(session, data):
+#       ...
+#
+#   session.send("ping:1")
+#   loop.run()
+
+
+@dataclass(slots=True)
+class Session:
+    ip: str = "localhost"
+    port: int = 8888
+    conn: socket.socket = None
+    uid: str = None
+    name: str = None
+    room: str = None
+    handlers: dict[str, Any] = field(default_factory=dict)
+    # whatever drives the session, a bot or a test
+    owner: Any = None
+    # unparsed tail of the last read
+    buffer: bytes = b""
+    # receive time and metadata of the message being handled
+    received: float = 0.0
+    meta: dict[str, str] = None
+
+    @property
+    def tag(self):
+        return self.name or self.uid
+
+    def handle(self, func):
+        part = partial(func, self)
+        self.handlers[func.__name__] = part
+        return part
+
+    def connect(self) -> Session:
+        self.conn = socket.create_connection((self.ip, self.port))
+        return self
+
+    def send(self, msg, meta: dict = None):
+        if msg:
+            self.conn.sendall(encode(msg, meta))
+
+    def dispatch(self, msgs, received: float = None):
+        for msg in msgs:
+            self.received = received or monotonic()
+            self.meta = frame_meta(msg)
+            if msg[0] in self.handlers:
+                self.handlers[msg[0]](msg[1])
+        self.meta = None
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+
+
+@dataclass(slots=True)
+class Loop:
+    selector: selectors.BaseSelector = field(default_factory=selectors.DefaultSelector)
+    # (when, order, callback) heap for call_later
+    timers: list[tuple[float, int, Callable]] = field(default_factory=list)
+    order: Any = field(default_factory=count)
+    stopped: bool = False
+
+    def open(self, session: Session) -> Session:
+        if session.conn is None:
+            session.connect()
+        self.selector.register(session.conn, selectors.EVENT_READ, session)
+        return session
+
+    @property
+    def sessions(self) -> int:
+        return len(self.selector.get_map())
+
+    def close(self, session: Session):
+        try:
+            self.selector.unregister(session.conn)
+        except (KeyError, ValueError):
+            pass
+        session.close()
+
+    def call_later(self, delay: float, callback: Callable):
+        heapq.heappush(self.timers, (monotonic() + delay, next(self.order), callback))
+
+    def stop(self):
+        self.stopped = True
+
+    # one round: waits for the next read or timer, at most timeout seconds
+    def step(self, timeout: float = None):
+        timers = self.timers
+        if timers:
+            wait = max(timers[0][0] - monotonic(), 0)
+            timeout = wait if timeout is None else min(timeout, wait)
+        for key, _ in self.selector.select(timeout):
+            session = key.data
+            try:
+                data = session.conn.recv(4096)
+            except OSError:
+                data = b""
+            if not data:
+                self.close(session)
+                # lets the owner know the server went away
+                session.dispatch([("closed", "")])
+                continue
+            received = monotonic()
+            msgs, session.buffer = split_frames(session.buffer + data)
+            session.dispatch(msgs, received)
+        now = monotonic()
+        while timers and timers[0][0] <= now:
+            heapq.heappop(timers)[2]()
+
+    # serves every session until stop() or until none are left
+    def run(self, until: float = None):
+        self.stopped = False
+        while not self.stopped and (self.sessions or self.timers):
+            if until is not None and monotonic() >= until:
+                return
+            self.step(None if until is None else until - monotonic())
+
+
+# load test: n sessions connect and ping the server, owner counts the pings
+# a session has left
+def ping_load(ip: str, port: int, sessions: int, pings: int) -> dict:
+    loop = Loop()
+    rtts = []
+
+    def pong(session: Session, data: str):
+        rtts.append(session.received - float(data))
+        session.owner -= 1
+        if session.owner:
+            session.send(f"ping:{monotonic()}")
+        else:
+            loop.close(session)
+
+    start = perf_counter()
+    opened = [loop.open(Session(ip, port, owner=pings)) for _ in range(sessions)]
+    connected = perf_counter() - start
+    for session in opened:
+        session.handle(pong)
+        session.send(f"ping:{monotonic()}")
+    start = perf_counter()
+    loop.run()
+    elapsed = perf_counter() - start
+
+    rtts.sort()
+    return {
+        "sessions": sessions,
+        "connects/s": sessions / connected,
+        "pings/s": len(rtts) / elapsed,
+        "rtt p50 ms": median(rtts) * 1000,
+        "rtt p95 ms": rtts[int(len(rtts) * 0.95)] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="many sessions, one process")
+    parser.add_argument("-n", "--sessions", type=int, default=1000)
+    parser.add_argument("--pings", type=int, default=10)
+    parser.add_argument("--ip", default="localhost")
+    parser.add_argument("--port", type=int, default=8888)
+    args = parser.parse_args()
+
+    result = ping_load(args.ip, args.port, args.sessions, args.pings)
+    print("  ".join(f"{key} {value:,.1f}" for key, value in result.items()))
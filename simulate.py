@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+from dataclasses import dataclass, field
+from multiprocessing import Pool
+from time import perf_counter
+
+from board import Board
+from core import calculate_actions, calculate_spawn_positions
+from player import Player
+from policies import POLICIES
+
+# headless self play. a Match plays the same rules as the networked game:
+# both sides set up their duke and two foot soldiers, get a seer and a priest
+# in the bag, and the host moves first. each ply the side to move either
+# moves a piece or draws from its bag and places the piece next to its duke.
+# the board is handed over with Board.swap_sides after every ply, so the side
+# to move always sees itself at the bottom like the client does.
+
+MAX_PLIES = 200
+LOG_KINDS = {"move": "m", "strike": "k", "command": "c"}
+
+
+@dataclass(slots=True)
+class Match:
+    policies: list
+    rng: random.Random = field(default_factory=random.Random)
+    max_plies: int = MAX_PLIES
+    board: Board = field(default_factory=Board)
+    players: list[Player] = field(default_factory=lambda: [Player(), Player()])
+    side: int = 0
+    plies: int = 0
+    winner: int | None = None
+    result: str = None
+    # one entry per action, coordinates seen from the acting side:
+    #   [side, "p", name, x, y]            setup placement
+    #   [side, "s", name, x, y]            spawn after a draw
+    #   [side, "m", px, py, x, y, name, flipped(, taken, taken_flipped)]
+    #   [side, "k", px, py, x, y, name, flipped, taken, taken_flipped]
+    #   [side, "c", px, py, ax, ay, x, y, name, flipped(, taken, taken_flipped)]
+    # name and flipped are the acting piece before it flips
+    log: list[list] = field(default_factory=list)
+
+    def choose(self, actions):
+        bags = tuple(len(self.players[side].bag) for side in (self.side, 1 - self.side))
+        return self.policies[self.side](self.board, actions, self.rng, bags)
+
+    def hand_over(self):
+        self.board.swap_sides()
+        self.side = 1 - self.side
+
+    def place(self, piece, kind):
+        squares = sorted(calculate_spawn_positions(piece, self.board))
+        if not squares:
+            return False
+        actions = [("place", piece.name, x, y) for x, y in squares]
+        _, name, x, y = self.choose(actions)
+        self.board.place_piece(x, y, piece)
+        self.log.append([self.side, kind, name, x, y])
+        return True
+
+    def setup(self):
+        for _ in range(2):
+            player = self.players[self.side]
+            while player.initial_pieces:
+                self.place(player.get_initial_piece(), "p")
+            player.give_pieces(["seer", "priest"])
+            self.hand_over()
+
+    def actions(self):
+        board = self.board
+        array = []
+        for x, row in enumerate(board.positions):
+            for y, piece in enumerate(row):
+                if piece and piece.is_own:
+                    array += calculate_actions(x, y, piece, board)
+
+        player = self.players[self.side]
+        if player.bag and calculate_spawn_positions(player.bag[0], board):
+            array.append(("draw",))
+        return array
+
+    def ply(self):
+        actions = self.actions()
+        if not actions:
+            self.result = "stuck"
+            return False
+
+        action = self.choose(actions)
+        if action[0] == "draw":
+            self.place(self.players[self.side].pull_piece(), "s")
+        else:
+            board = self.board
+            px, py = action[1:3]
+            x, y = action[-2:]
+            piece = board.get_piece(px, py)
+            target = board.get_piece(x, y)
+            entry = [self.side, LOG_KINDS[action[0]], *action[1:], piece.name]
+            entry.append(int(piece.is_flipped))
+            if target:
+                entry += [target.name, int(target.is_flipped)]
+            self.log.append(entry)
+            match action:
+                case ("move", _, _, _, _):
+                    board.move_piece(px, py, x, y)
+                case ("strike", _, _, _, _):
+                    board.place_piece(x, y, None)
+                    board.flip_piece(px, py)
+                case ("command", _, _, ax, ay, _, _):
+                    board.shift_piece(ax, ay, x, y)
+                    board.flip_piece(px, py)
+            if target and target.tag == "DUKE":
+                self.plies += 1
+                self.winner = self.side
+                self.result = "duke"
+                return False
+
+        self.plies += 1
+        self.hand_over()
+        return True
+
+    def play(self) -> Match:
+        self.setup()
+        while self.plies < self.max_plies and self.ply():
+            pass
+        if self.result is None:
+            self.result = "plies"
+        return self
+
+
+# pull_piece draws from the global random module, so it is seeded per game
+def play_game(job) -> dict:
+    index, seed, names, max_plies = job
+    random.seed(seed)
+    match = Match(
+        [POLICIES[name] for name in names],
+        rng=random.Random(seed),
+        max_plies=max_plies,
+    ).play()
+    return {
+        "game": index,
+        "seed": seed,
+        "players": names,
+        "winner": match.winner,
+        "result": match.result,
+        "plies": match.plies,
+        "log": match.log,
+    }
+
+
+def jobs(games: int, names: list[str], seed: int, max_plies: int):
+    for index in range(games):
+        # alternate who moves first
+        order = names if index % 2 == 0 else names[::-1]
+        yield index, seed * 1_000_003 + index, list(order), max_plies
+
+
+def run(games, names, seed=0, processes=None, out=sys.stdout, max_plies=MAX_PLIES):
+    wins = {name: 0 for name in names}
+    draws = 0
+    with Pool(processes) as pool:
+        results = pool.imap_unordered(
+            play_game, jobs(games, names, seed, max_plies), chunksize=64
+        )
+        for record in results:
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+            if record["winner"] is None:
+                draws += 1
+            else:
+                wins[record["players"][record["winner"]]] += 1
+    return wins, draws
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="headless self play")
+    parser.add_argument("-n", "--games", type=int, default=1000)
+    parser.add_argument("-p", "--policies", nargs=2, default=["random", "random"])
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-o", "--out", default=None)
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    args = parser.parse_args()
+
+    for name in args.policies:
+        if name not in POLICIES:
+            sys.exit(f"unknown policy {name}, choose from {', '.join(POLICIES)}")
+
+    start = perf_counter()
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        wins, draws = run(
+            args.games, args.policies, args.seed, args.processes, out, args.max_plies
+        )
+    finally:
+        if args.out:
+            out.close()
+    elapsed = perf_counter() - start
+
+    print(
+        f"{args.games} games in {elapsed:.1f}s ({args.games / elapsed:.0f}/s) "
+        f"wins {wins} draws {draws}",
+        file=sys.stderr,
+    )
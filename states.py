@@ -1,11 +1,10 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from typing import TYPE_CHECKING
 
-import pyxel
-
-from core import calculate_moves, calculate_spawn_positions
+from core import cached_moves, cached_spawn_positions
+from render import pyxel
 
 if TYPE_CHECKING:
     from game import Game
@@ -26,8 +25,13 @@ class MenuState:
         if pyxel.btnp(pyxel.KEY_F5):
             self.game.client.send("get_rooms:")
 
+        # a bot takes the other seat of the room we wait in
+        if pyxel.btnp(pyxel.KEY_F6) and self.game.room:
+            self.game.client.send("bot:")
+
         if pyxel.btnp(pyxel.KEY_BACKSPACE):
             self.room = self.room[:-1]
+            self.game.mark_dirty()
             return
 
         if pyxel.btnp(pyxel.KEY_RETURN):
@@ -39,6 +43,7 @@ class MenuState:
         for k in range(97, 122):
             if pyxel.btnp(k):
                 self.room += chr(k)
+                self.game.mark_dirty()
                 break
 
     def draw(self):
@@ -50,7 +55,7 @@ class MenuState:
 @dataclass
 class SetupState:
     game: Game
-    possible_positions: tuple[int, int] = field(default_factory=list)
+    possible_positions: frozenset[tuple[int, int]] = frozenset()
     is_finished: bool = False
 
     def update(self):
@@ -73,11 +78,13 @@ class SetupState:
 
         if game.in_hand is None:
             game.in_hand = game.player.get_initial_piece()
+            game.mark_dirty()
 
         if game.in_hand:
-            self.possible_positions = calculate_spawn_positions(
-                game.in_hand, game.board
-            )
+            positions = cached_spawn_positions(game.in_hand, game.board)
+            if positions is not self.possible_positions:
+                self.possible_positions = positions
+                game.mark_dirty()
 
         if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT) and game.in_hand:
             x = pyxel.mouse_x // 32
@@ -85,7 +92,8 @@ class SetupState:
             if (x, y) in self.possible_positions:
                 game.board.place_piece(x, y, game.in_hand)
                 game.in_hand = None
-                self.possible_positions = []
+                self.possible_positions = frozenset()
+                game.mark_dirty()
 
     def draw(self):
         game = self.game
@@ -108,7 +116,8 @@ class SetupState:
 class PlayerTurnState:
     def __init__(self, game):
         self.game = game
-        self.possible_positions = []
+        self.possible_positions = frozenset()
+        self.captures = frozenset()
         self.highlight = None
         self.target = None
         self.phase = "standby"
@@ -151,10 +160,11 @@ class PlayerTurnState:
                 if pyxel.btnp(pyxel.MOUSE_BUTTON_RIGHT):
                     game.in_hand = game.player.pull_piece()
                     if game.in_hand:
-                        self.possible_positions = calculate_spawn_positions(
+                        self.possible_positions = cached_spawn_positions(
                             game.in_hand, game.board
                         )
                         self.phase = "spawning"
+                        game.mark_dirty()
                         return
                     else:
                         return
@@ -166,11 +176,15 @@ class PlayerTurnState:
                     and piece
                     and piece.is_own
                 ):
-                    self.possible_positions = calculate_moves(x, y, piece, board)
+                    self.possible_positions = cached_moves(x, y, board)
+                    self.captures = frozenset(
+                        pos for pos in self.possible_positions if board.get_piece(*pos)
+                    )
                     if len(self.possible_positions) > 0:
                         game.active = piece
                         self.highlight = (x, y)
                         self.phase = "acting"
+                        game.mark_dirty()
                         return
 
             case "spawning":
@@ -181,37 +195,34 @@ class PlayerTurnState:
                     board.place_piece(x, y, game.in_hand)
                     piece_name = game.in_hand.name
                     game.in_hand = None
-                    self.possible_positions = []
+                    self.possible_positions = frozenset()
                     self.phase = "standby"
                     # send piece name and position in spawned
-                    game.client.send(f"spawn_opponent:{piece_name}->{x},{y}")
-                    game.wait()
+                    game.play(f"spawn_opponent:{piece_name}->{x},{y}")
                     return
 
             case "acting":
                 if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
                     if (x, y) in self.possible_positions:
-                        # TODO make this better
-                        board.place_piece(x, y, game.active)
-                        game.active.flip()
-                        board.positions[self.highlight[0]][self.highlight[1]] = None
+                        board.move_piece(self.highlight[0], self.highlight[1], x, y)
                         # send previous and next position of moved piece
-                        game.client.send(
+                        game.play(
                             f"move:{self.highlight[0]},{self.highlight[1]}->{x},{y}"
                         )
 
                         self.highlight = None
                         game.active = None
-                        self.possible_positions = []
+                        self.possible_positions = frozenset()
+                        self.captures = frozenset()
                         self.phase = "standby"
-                        # TODO here wait
-                        game.wait()
                         return
                     else:
                         game.active = None
                         self.highlight = None
-                        self.possible_positions = []
+                        self.possible_positions = frozenset()
+                        self.captures = frozenset()
                         self.phase = "standby"
+                        game.mark_dirty()
                         return
 
     def draw(self):
@@ -221,8 +232,7 @@ class PlayerTurnState:
         game.board.draw()
         # draw possible positions
         for tile in self.possible_positions:
-            piece = game.board.get_piece(tile[0], tile[1])
-            if piece and piece.is_own != game.active.is_own:
+            if tile in self.captures:
                 pyxel.rectb(
                     tile[0] * t,
                     tile[1] * t,
@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import argparse
+import mmap
+import struct
+import sys
+from functools import lru_cache
+from itertools import combinations_with_replacement
+from multiprocessing import Pool
+from time import perf_counter
+
+import numpy as np
+
+from board import Board
+from codec import CODES, FLIPPED, NAMES, OWN
+from core import calculate_actions
+from piece import PIECES, Piece
+
+# endgame tablebase for positions with both dukes and up to k pieces in all,
+# solved by retrograde analysis with empty bags.
+#
+# a position is seen from the side to move, like Board. its pieces are
+# (kind, square, flipped) with kind the codec byte without the flipped bit and
+# square x * 6 + y. the pieces sorted by kind make up the signature, each
+# signature owns a table of 72 ** n bytes indexed by
+#
+#   sum((square * 2 + flipped) * 72 ** slot)     in signature order
+#
+# pieces of the same kind go in square order, every other index is illegal.
+# one byte per position:
+#
+#   0          illegal
+#   1          draw, or stuck with no moves
+#   2..127     win, the duke is taken in byte - 1 plies
+#   128..255   loss, the duke is lost in byte - 128 plies
+#
+# file: header, signature directory, then the tables back to back
+#
+#   "DUKETB01" k:u16 count:u16 names_length:u16 names(utf-8, comma separated)
+#   count x (n:u8 kinds:8s offset:u64)
+
+MAGIC = b"DUKETB01"
+HEADER = struct.Struct("<8sHHH")
+ENTRY = struct.Struct("<B8sQ")
+SLOT = 72
+
+ILLEGAL = 0
+DRAW = 1
+LOSS = 128
+MAX_DTC = 126
+
+DUKE = CODES["duke", True, False]
+
+
+def kind_name(kind: int) -> str:
+    return NAMES[(kind & 0x3F) - 1]
+
+
+def decode_value(value: int) -> tuple[str, int] | None:
+    if value == ILLEGAL:
+        return None
+    if value == DRAW:
+        return "draw", 0
+    if value < LOSS:
+        return "win", value - 1
+    return "loss", value - LOSS
+
+
+def signatures(names: tuple[str, ...], k: int) -> list[bytes]:
+    kinds = [
+        CODES[name, is_own, False]
+        for name in names
+        if name != "duke"
+        for is_own in (True, False)
+    ]
+    array = []
+    for extra in range(k - 1):
+        for others in combinations_with_replacement(kinds, extra):
+            array.append(bytes(sorted((DUKE, DUKE ^ OWN, *others))))
+    return array
+
+
+def index_of(pieces: list[tuple[int, int, int]]) -> tuple[bytes, int]:
+    pieces.sort()
+    index = 0
+    scale = 1
+    for _, square, flipped in pieces:
+        index += (square * 2 + flipped) * scale
+        scale *= SLOT
+    return bytes(kind for kind, _, _ in pieces), index
+
+
+def pieces_of(data: bytes) -> list[tuple[int, int, int]]:
+    return [
+        (code & ~FLIPPED, square, (code & FLIPPED) >> 6)
+        for square, code in enumerate(data)
+        if code
+    ]
+
+
+# the position after an own action (see core.calculate_actions), seen by the
+# other side, or None when the action takes the duke
+def after_action(pieces, action):
+    source = action[1] * 6 + action[2]
+    target = action[-2] * 6 + action[-1]
+    if action[0] == "command":
+        mover = action[3] * 6 + action[4]
+    elif action[0] == "move":
+        mover = source
+    else:
+        mover = None
+    array = []
+    for kind, at, flipped in pieces:
+        if at == target:
+            if kind & ~OWN == DUKE & ~OWN:
+                return None
+            continue
+        if at == source:
+            flipped ^= 1
+        if at == mover:
+            at = target
+        array.append((kind ^ OWN, 35 - at, flipped))
+    return array
+
+
+@lru_cache(1)
+def layout(names: tuple[str, ...], k: int) -> tuple[list[bytes], dict[bytes, int]]:
+    sigs = signatures(names, k)
+    offsets = {}
+    total = 0
+    for sig in sigs:
+        offsets[sig] = total
+        total += SLOT ** len(sig)
+    return sigs, offsets
+
+
+# forward graph of one signature: per position its flags and children
+def expand(job):
+    names, k, sig = job
+    _, offsets = layout(names, k)
+    n = len(sig)
+    size = SLOT**n
+    legal = np.zeros(size, dtype=bool)
+    capture = np.zeros(size, dtype=bool)
+    degree = np.zeros(size, dtype=np.int32)
+    children = []
+
+    protos = {
+        (kind, flipped): Piece(
+            kind_name(kind), is_own=bool(kind & OWN), is_flipped=bool(flipped)
+        )
+        for kind in set(sig)
+        for flipped in (0, 1)
+    }
+    board = Board()
+    positions = board.positions
+
+    for index in range(size):
+        pieces = []
+        rest = index
+        previous = None
+        for kind in sig:
+            slot = rest % SLOT
+            rest //= SLOT
+            square = slot >> 1
+            pieces.append((kind, square, slot & 1))
+            if previous and previous[0] == kind and previous[1] >= square:
+                break
+            previous = (kind, square)
+        else:
+            squares = {square for _, square, _ in pieces}
+            if len(squares) != n:
+                continue
+            legal[index] = True
+            for kind, square, flipped in pieces:
+                positions[square // 6][square % 6] = protos[kind, flipped]
+
+            count = 0
+            for kind, square, flipped in pieces:
+                if not kind & OWN:
+                    continue
+                x, y = divmod(square, 6)
+                for action in calculate_actions(x, y, positions[x][y], board):
+                    child = after_action(pieces, action)
+                    if child is None:
+                        capture[index] = True
+                        continue
+                    child_sig, child_index = index_of(child)
+                    children.append(offsets[child_sig] + child_index)
+                    count += 1
+            degree[index] = count
+
+            for _, square, _ in pieces:
+                positions[square // 6][square % 6] = None
+
+    return sig, legal, capture, degree, np.array(children, dtype=np.int32)
+
+
+# layered retrograde analysis: a position is won in d plies when a move leads
+# to a position lost in d - 1, and lost in d when every move leads to a
+# position won in less than d. whatever is left at the end is a draw
+def solve(legal, capture, degree, children) -> np.ndarray:
+    total = len(legal)
+    parents = np.repeat(np.arange(total, dtype=np.int32), degree)
+    state = np.zeros(total, dtype=np.uint8)
+    dtc = np.zeros(total, dtype=np.uint8)
+    WIN, LOST = 1, 2
+
+    state[capture] = WIN
+    dtc[capture] = 1
+    open_ = legal & ~capture & (degree > 0)
+
+    for d in range(2, MAX_DTC + 1):
+        child_state = state[children]
+        lost_before = (child_state == LOST) & (dtc[children] == d - 1)
+        won = np.bincount(parents[lost_before], minlength=total) > 0
+        wins = np.bincount(parents[child_state == WIN], minlength=total)
+        lost = (wins == degree) & ~won
+        won &= open_
+        lost &= open_
+        if not won.any() and not lost.any():
+            break
+        state[won] = WIN
+        state[lost] = LOST
+        dtc[won | lost] = d
+        open_ &= ~(won | lost)
+
+    values = np.where(legal, DRAW, ILLEGAL).astype(np.uint8)
+    values[state == WIN] = dtc[state == WIN] + 1
+    values[state == LOST] = dtc[state == LOST] + LOSS
+    return values
+
+
+def generate(names: tuple[str, ...], k: int, processes=None) -> dict[bytes, np.ndarray]:
+    sigs, offsets = layout(names, k)
+    parts = {}
+    with Pool(processes) as pool:
+        for part in pool.imap_unordered(expand, [(names, k, sig) for sig in sigs]):
+            parts[part[0]] = part[1:]
+
+    legal, capture, degree, children = (
+        np.concatenate([parts[sig][i] for sig in sigs]) for i in range(4)
+    )
+    values = solve(legal, capture, degree, children)
+    return {sig: values[offsets[sig] : offsets[sig] + SLOT ** len(sig)] for sig in sigs}
+
+
+def write(path, k: int, tables: dict[bytes, np.ndarray]):
+    names = ",".join(NAMES).encode("utf-8")
+    offset = HEADER.size + len(names) + ENTRY.size * len(tables)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, k, len(tables), len(names)))
+        f.write(names)
+        for sig, values in tables.items():
+            f.write(ENTRY.pack(len(sig), sig, offset))
+            offset += len(values)
+        for values in tables.values():
+            f.write(values.tobytes())
+
+
+class Tablebase:
+    __slots__ = ("k", "tables", "file", "data")
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.k, count, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a tablebase")
+        names = bytes(self.data[HEADER.size : HEADER.size + length]).decode("utf-8")
+        if names.split(",") != NAMES:
+            raise ValueError(f"{path} was built for pieces {names}")
+        self.tables = {}
+        for i in range(count):
+            n, kinds, offset = ENTRY.unpack_from(
+                self.data, HEADER.size + length + i * ENTRY.size
+            )
+            self.tables[kinds[:n]] = offset
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def probe_pieces(self, pieces) -> tuple[str, int] | None:
+        if len(pieces) > self.k:
+            return None
+        sig, index = index_of(pieces)
+        offset = self.tables.get(sig)
+        if offset is None:
+            return None
+        return decode_value(self.data[offset + index])
+
+    def probe_data(self, data: bytes) -> tuple[str, int] | None:
+        return self.probe_pieces(pieces_of(data))
+
+    # result for the side to move, None when the position is not covered
+    def probe(self, board: Board) -> tuple[str, int] | None:
+        return self.probe_data(board.snapshot())
+
+    # result for the opponent after an own action
+    def probe_action(self, board: Board, action) -> tuple[str, int] | None:
+        child = after_action(pieces_of(board.snapshot()), action)
+        if child is None:
+            return "loss", 0
+        return self.probe_pieces(child)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate the endgame tablebase")
+    parser.add_argument("-k", type=int, default=3, help="most pieces on the board")
+    parser.add_argument("-p", "--pieces", nargs="*", default=list(PIECES))
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("-o", "--out", default="endgame.tb")
+    args = parser.parse_args()
+
+    if not 2 <= args.k <= 8:
+        sys.exit("k must be between 2 and 8")
+    for name in args.pieces:
+        if name not in NAMES:
+            sys.exit(f"unknown piece {name}, choose from {', '.join(NAMES)}")
+
+    start = perf_counter()
+    tables = generate(tuple(args.pieces), args.k, args.processes)
+    write(args.out, args.k, tables)
+    values = np.concatenate(list(tables.values()))
+    print(
+        f"{len(tables)} signatures, {np.count_nonzero(values)} positions "
+        f"({np.count_nonzero((values > DRAW) & (values < LOSS))} won, "
+        f"{np.count_nonzero(values >= LOSS)} lost) in {perf_counter() - start:.1f}s"
+    )
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from moves import Move, create_move
+from piece import EXTRA_PIECES, PIECES
+
+# per piece type action tables. every (name, is_flipped) gets one entry per
+# square with the targets already clipped to the board, so generation only
+# looks at occupancy:
+#
+#   steps     (target, path) plain moves need an empty path, jumps have none
+#   slides    (ray, is_jump) squares in order, a jump slide passes over pieces
+#   strikes   squares an enemy can be taken on without moving
+#   commands  squares the piece can move own pieces between
+#
+# shields are looked up from the other side: SHIELDS[name, is_flipped, is_own]
+# holds, per square, the squares from which a piece standing there can not be
+# captured or struck. opponent pieces face the other way, so theirs are
+# mirrored.
+
+SIZE = 6
+
+Square = tuple[int, int]
+
+
+@dataclass(slots=True)
+class ActionTable:
+    steps: list[tuple[Square, tuple[Square, ...]]] = field(default_factory=list)
+    slides: list[tuple[tuple[Square, ...], bool]] = field(default_factory=list)
+    strikes: list[Square] = field(default_factory=list)
+    commands: list[Square] = field(default_factory=list)
+
+
+def on_board(x, y) -> bool:
+    return 0 <= x < SIZE and 0 <= y < SIZE
+
+
+# unit direction and distance of a move, moves are multiples of one step
+def direction(move: Move) -> tuple[int, int, int]:
+    distance = max(abs(move.dx), abs(move.dy))
+    return move.dx // distance, move.dy // distance, distance
+
+
+def square_table(moves: list[Move], px, py) -> ActionTable:
+    table = ActionTable()
+    for move in moves:
+        if move.dx == move.dy == 0:
+            continue
+        x = px + move.dx
+        y = py + move.dy
+        ux, uy, distance = direction(move)
+        if move.is_strike:
+            if on_board(x, y):
+                table.strikes.append((x, y))
+        elif move.is_command:
+            if on_board(x, y):
+                table.commands.append((x, y))
+        elif move.is_shield:
+            continue
+        elif move.is_slide:
+            ray = []
+            while on_board(x, y):
+                ray.append((x, y))
+                x += move.dx
+                y += move.dy
+            if ray:
+                table.slides.append((tuple(ray), move.is_jump))
+        elif on_board(x, y):
+            path = ()
+            if not move.is_jump:
+                path = tuple((px + ux * d, py + uy * d) for d in range(1, distance))
+            table.steps.append(((x, y), path))
+    return table
+
+
+def build_tables(pieces: dict = PIECES):
+    tables = {}
+    shields = {}
+    for name, (normal, flipped) in pieces.items():
+        for is_flipped, raw_moves in ((False, normal), (True, flipped)):
+            moves = [create_move(raw) for raw in raw_moves]
+            tables[name, is_flipped] = [
+                [square_table(moves, x, y) for y in range(SIZE)] for x in range(SIZE)
+            ]
+            offsets = [(move.dx, move.dy) for move in moves if move.is_shield]
+            if not offsets:
+                continue
+            for is_own, sign in ((True, 1), (False, -1)):
+                shields[name, is_flipped, is_own] = [
+                    [
+                        frozenset(
+                            (x + sign * dx, y + sign * dy)
+                            for dx, dy in offsets
+                            if on_board(x + sign * dx, y + sign * dy)
+                        )
+                        for y in range(SIZE)
+                    ]
+                    for x in range(SIZE)
+                ]
+    return tables, shields
+
+
+TABLES, SHIELDS = build_tables()
+
+
+# makes pieces outside PIECES known to Piece and the move generator
+def register_pieces(pieces: dict):
+    EXTRA_PIECES.update(pieces)
+    tables, shields = build_tables(pieces)
+    TABLES.update(tables)
+    SHIELDS.update(shields)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import zlib
+from dataclasses import dataclass
+from itertools import combinations
+from math import log10, sqrt
+from multiprocessing import Pool
+from time import perf_counter
+
+from policies import POLICIES
+from ratings import expected
+from simulate import MAX_PLIES, jobs, play_game
+
+# engine tournaments between policies, played headless with simulate.py.
+# every pairing gets its own seed derived from the tournament seed and the two
+# names, so a pairing replays the same games (bag draws included) whatever
+# else is scheduled. the stream file gets one line per game, in schedule
+# order, with the ratings after it, and a standings line every --report games
+# and at the end:
+#
+#   {"pairing": 0, "game": 3, "players": [..], "winner": 1, ..., "ratings": {..}}
+#   {"standings": [{"name": .., "elo": .., "margin": .., "games": .., ...}]}
+#
+# elo is updated game by game (K = 16, everyone starts at 0). the margin is
+# the 95% interval of the performance against the field, from the variance
+# of the scores so far.
+
+K = 16
+Z95 = 1.96
+
+
+@dataclass(slots=True)
+class Entrant:
+    name: str
+    elo: float = 0.0
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    @property
+    def score(self):
+        return (self.wins + self.draws / 2) / self.games if self.games else 0.5
+
+    # half width of the 95% interval in elo
+    @property
+    def margin(self):
+        games = self.games
+        if not games:
+            return float("inf")
+        score = self.score
+        variance = (
+            self.wins * (1 - score) ** 2
+            + self.draws * (0.5 - score) ** 2
+            + self.losses * score**2
+        ) / games
+        error = Z95 * sqrt(variance / games)
+        return (elo_of(score + error) - elo_of(score - error)) / 2
+
+    def report(self) -> dict:
+        return {
+            "name": self.name,
+            "elo": round(self.elo, 1),
+            "margin": round(self.margin, 1),
+            "games": self.games,
+            "wins": self.wins,
+            "draws": self.draws,
+            "losses": self.losses,
+            "score": round(self.score, 4),
+        }
+
+
+# elo difference for an expected score, clamped so sweeps stay finite
+def elo_of(score: float) -> float:
+    score = min(max(score, 0.001), 0.999)
+    return -400 * log10(1 / score - 1)
+
+
+@dataclass(slots=True)
+class Standings:
+    entrants: dict[str, Entrant]
+
+    @classmethod
+    def of(cls, names: list[str]) -> Standings:
+        return cls({name: Entrant(name) for name in names})
+
+    def add(self, players: list[str], winner: int | None):
+        first, second = (self.entrants[name] for name in players)
+        if winner is None:
+            score = 0.5
+            first.draws += 1
+            second.draws += 1
+        elif winner == 0:
+            score = 1.0
+            first.wins += 1
+            second.losses += 1
+        else:
+            score = 0.0
+            first.losses += 1
+            second.wins += 1
+        delta = K * (score - expected(first.elo, second.elo))
+        first.elo += delta
+        second.elo -= delta
+
+    def ratings(self) -> dict[str, float]:
+        return {name: round(entrant.elo, 1) for name, entrant in self.entrants.items()}
+
+    def table(self) -> list[dict]:
+        entrants = sorted(self.entrants.values(), key=lambda e: e.elo, reverse=True)
+        return [entrant.report() for entrant in entrants]
+
+
+def pairings(names: list[str], gauntlet: str = None) -> list[tuple[str, str]]:
+    if gauntlet:
+        return [(gauntlet, name) for name in names if name != gauntlet]
+    return list(combinations(names, 2))
+
+
+def pairing_seed(seed: int, pair: tuple[str, str]) -> int:
+    return zlib.crc32(f"{seed}:{pair[0]}:{pair[1]}".encode())
+
+
+def schedule(pairs, games: int, seed: int, max_plies: int, keep_logs: bool):
+    for number, pair in enumerate(pairs):
+        for job in jobs(games, list(pair), pairing_seed(seed, pair), max_plies):
+            yield number, keep_logs, job
+
+
+def play(job) -> dict:
+    number, keep_logs, game = job
+    record = play_game(game)
+    if not keep_logs:
+        del record["log"]
+    return {"pairing": number, **record}
+
+
+def run(
+    names,
+    games,
+    gauntlet=None,
+    seed=0,
+    processes=None,
+    out=None,
+    max_plies=MAX_PLIES,
+    report=500,
+    keep_logs=False,
+) -> Standings:
+    standings = Standings.of(names)
+    pairs = pairings(names, gauntlet)
+    with Pool(processes) as pool:
+        # in order, so the incremental ratings do not depend on the workers
+        results = pool.imap(
+            play, schedule(pairs, games, seed, max_plies, keep_logs), chunksize=16
+        )
+        for played, record in enumerate(results, 1):
+            standings.add(record["players"], record["winner"])
+            if out:
+                record["ratings"] = standings.ratings()
+                out.write(json.dumps(record, separators=(",", ":")) + "\n")
+                if report and played % report == 0:
+                    out.write(json.dumps({"standings": standings.table()}) + "\n")
+                    out.flush()
+    if out:
+        out.write(json.dumps({"standings": standings.table()}) + "\n")
+    return standings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tournament between policies")
+    parser.add_argument("policies", nargs="*", default=list(POLICIES))
+    parser.add_argument("-n", "--games", type=int, default=100, help="per pairing")
+    parser.add_argument("-g", "--gauntlet", default=None, help="play only this one")
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-o", "--out", default="tournament.jsonl")
+    parser.add_argument("--report", type=int, default=500)
+    parser.add_argument("--logs", action="store_true", help="keep the move logs")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    args = parser.parse_args()
+
+    names = list(dict.fromkeys(args.policies))
+    if args.gauntlet and args.gauntlet not in names:
+        names.insert(0, args.gauntlet)
+    for name in names:
+        if name not in POLICIES:
+            sys.exit(f"unknown policy {name}, choose from {', '.join(POLICIES)}")
+    if len(names) < 2:
+        sys.exit("a tournament needs at least two policies")
+
+    start = perf_counter()
+    with open(args.out, "w") as out:
+        standings = run(
+            names,
+            args.games,
+            args.gauntlet,
+            args.seed,
+            args.processes,
+            out,
+            args.max_plies,
+            args.report,
+            args.logs,
+        )
+    elapsed = perf_counter() - start
+
+    total = len(pairings(names, args.gauntlet)) * args.games
+    print(f"{total} games in {elapsed:.1f}s ({total / elapsed:.0f}/s)")
+    for row in standings.table():
+        print(
+            f"{row['name']:<10} {row['elo']:>7.1f} +/- {row['margin']:<6.1f} "
+            f"{row['wins']:>6}W {row['draws']:>5}D {row['losses']:>6}L"
+        )
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+from collections import deque
+from dataclasses import dataclass, field
+from math import inf
+from statistics import fmean, median
+from time import monotonic
+
+# end to end latency of relayed moves. the sender stamps a trace id, its send
+# time and its clock offset to the server; the server adds its receive and
+# relay times and the opponent closes the trace when it dispatches the move:
+#
+#   uplink    sender -> server         sr - (cs + sender offset)
+#   server    inside the relay         ss - sr
+#   downlink  server -> opponent       (received + own offset) - ss
+#   queue     inbox wait on the game   dispatched - received
+#
+# offsets are server clock minus local clock, estimated from ping/pong.
+
+HOPS = ("uplink", "server", "downlink", "queue", "total")
+
+
+@dataclass(slots=True)
+class ClockSync:
+    # server clock minus local clock, taken from the lowest rtt sample
+    offset: float = 0.0
+    rtt: float = inf
+    samples: deque = field(default_factory=lambda: deque(maxlen=8))
+
+    def sample(self, sent: float, server_time: float, received: float):
+        rtt = received - sent
+        self.samples.append((rtt, server_time - (sent + received) / 2))
+        self.rtt, self.offset = min(self.samples)
+
+
+@dataclass(slots=True)
+class LatencyStats:
+    hops: dict[str, list[float]] = field(
+        default_factory=lambda: {hop: [] for hop in HOPS}
+    )
+
+    def add(self, **hops: float):
+        for hop, value in hops.items():
+            self.hops[hop].append(value)
+
+    def __len__(self):
+        return len(self.hops["total"]) or len(self.hops["server"])
+
+    # milliseconds per hop
+    def summary(self) -> dict[str, dict[str, float]]:
+        result = {}
+        for hop, values in self.hops.items():
+            if values:
+                ordered = sorted(values)
+                result[hop] = {
+                    "mean": round(fmean(ordered) * 1000, 3),
+                    "p50": round(median(ordered) * 1000, 3),
+                    "p95": round(ordered[int(len(ordered) * 0.95)] * 1000, 3),
+                    "max": round(ordered[-1] * 1000, 3),
+                }
+        return result
+
+    def clear(self):
+        for values in self.hops.values():
+            values.clear()
+
+
+def write_summary(path: str, record: dict):
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+@dataclass(slots=True)
+class Tracer:
+    path: str = None
+    clock: ClockSync = field(default_factory=ClockSync)
+    stats: LatencyStats = field(default_factory=LatencyStats)
+    next_id: int = 0
+    last_ping: float = -inf
+
+    def should_ping(self, interval: float = 2.0) -> bool:
+        now = monotonic()
+        if now - self.last_ping >= interval:
+            self.last_ping = now
+            return True
+        return False
+
+    def stamp(self, uid: str) -> dict:
+        self.next_id += 1
+        return {
+            "tid": f"{uid}-{self.next_id}",
+            "cs": f"{monotonic():.6f}",
+            "co": f"{self.clock.offset:.6f}",
+        }
+
+    def receive(self, meta: dict[str, str], received: float):
+        if "ss" not in meta:
+            return
+        dispatched = monotonic()
+        cs, co, sr, ss = (float(meta[key]) for key in ("cs", "co", "sr", "ss"))
+        uplink = sr - (cs + co)
+        server = ss - sr
+        downlink = received + self.clock.offset - ss
+        queue = dispatched - received
+        self.stats.add(
+            uplink=uplink,
+            server=server,
+            downlink=downlink,
+            queue=queue,
+            total=uplink + server + downlink + queue,
+        )
+
+    # writes one line per match and starts over
+    def flush(self, **info):
+        if self.path and len(self.stats):
+            record = dict(info)
+            record["samples"] = len(self.stats)
+            record["clock"] = {"offset": self.clock.offset, "rtt": self.clock.rtt}
+            record["hops"] = self.stats.summary()
+            write_summary(self.path, record)
+        self.stats.clear()